@@ -0,0 +1,78 @@
+"""Per-row cost of rendering a page of movies, before and after the fast JSON path.
+
+    python -m benchmarks.serialization --rows 100 --repeat 200
+
+Needs no database: the ORM objects and column tuples are built in memory, so only the
+serialization side of a list endpoint is measured.
+"""
+import argparse
+import asyncio
+import json
+import timeit
+import orjson
+from datetime import date, time
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from fastapi.encoders import jsonable_encoder
+from movie_app import cache
+from movie_app.api.movie import MOVIE_ROWS
+from movie_app.db.models import Movie, StatusChoices, TypeChoices
+from movie_app.db.schema import MovieSchema, Page
+
+
+def make_rows(count: int):
+    rows = [(f'Movie {i}', f'https://example.com/trailer/{i}', f'movie_images/{i}.jpg', StatusChoices.pro,
+             date(1990 + i % 30, 1 + i % 12, 1), [TypeChoices.p360, TypeChoices.p480], time(1, 30 + i % 30),
+             'A fairly long description of the movie that a catalog page would show. ' * 3, 1 + i % 50,
+             i if i % 2 else None, i) for i in range(count)]
+    movies = [Movie(**dict(zip(MOVIE_ROWS.fields, row))) for row in rows]
+    return rows, movies
+
+
+def fastapi_default(loop, field, movies):
+    # what a route returning ORM objects with response_model=Page[MovieSchema] does
+    content = loop.run_until_complete(
+        serialize_response(field=field, response_content={'items': movies, 'next_cursor': None}))
+    return json.dumps(jsonable_encoder(content)).encode()
+
+
+def cached_dump(movies):
+    return cache.dump(Page[MovieSchema], {'items': movies, 'next_cursor': None})
+
+
+def strict_path(rows):
+    # the same column tuples checked by the precompiled TypeAdapter before orjson writes them
+    items = MOVIE_ROWS.adapter.dump_python(MOVIE_ROWS.validate(rows), mode='json')
+    return orjson.dumps({'items': items, 'next_cursor': None})
+
+
+def fast_path(rows):
+    return MOVIE_ROWS.dump({'items': rows, 'next_cursor': None})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    rows, movies = make_rows(args.rows)
+    loop = asyncio.new_event_loop()
+    field = create_model_field(name='response', type_=Page[MovieSchema], mode='serialization')
+    expected = json.loads(cached_dump(movies))
+    assert json.loads(fast_path(rows)) == expected, 'fast path output differs from the schema output'
+    assert json.loads(strict_path(rows)) == expected
+    assert json.loads(fastapi_default(loop, field, movies)) == expected
+
+    cases = [('response_model + jsonable_encoder', lambda: fastapi_default(loop, field, movies)),
+             ('TypeAdapter from_attributes', lambda: cached_dump(movies)),
+             ('column tuples + TypeAdapter + orjson', lambda: strict_path(rows)),
+             ('column tuples + orjson', lambda: fast_path(rows))]
+    print(f'{args.rows} rows per page, best of 5 x {args.repeat}')
+    for name, case in cases:
+        best = min(timeit.repeat(case, number=args.repeat, repeat=5)) / args.repeat
+        print(f'{name:<36} {best * 1e6 / args.rows:8.2f} us/row {best * 1e3:8.3f} ms/page')
+
+
+if __name__ == '__main__':
+    main()
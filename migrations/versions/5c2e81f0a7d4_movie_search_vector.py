@@ -0,0 +1,35 @@
+"""movie search vector
+
+Revision ID: 5c2e81f0a7d4
+Revises: 07ba74bd4ca1
+Create Date: 2026-10-18 10:12:41.508213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e81f0a7d4'
+down_revision: Union[str, None] = '07ba74bd4ca1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('movie', sa.Column(
+        'search_vector', postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('simple', coalesce(movie_name, '') || ' ' || coalesce(description, ''))",
+                    persisted=True),
+        nullable=True))
+    op.create_index('ix_movie_search_vector', 'movie', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_movie_search_vector', table_name='movie', postgresql_using='gin')
+    op.drop_column('movie', 'search_vector')
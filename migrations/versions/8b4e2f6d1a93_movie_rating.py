@@ -0,0 +1,57 @@
+"""movie rating
+
+Revision ID: 8b4e2f6d1a93
+Revises: f3d8c51a6e20
+Create Date: 2026-10-18 15:12:27.804416
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e2f6d1a93'
+down_revision: Union[str, None] = 'f3d8c51a6e20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('movie_rating',
+    sa.Column('movie_id', sa.Integer(), nullable=False),
+    sa.Column('rating_count', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.Integer(), nullable=False),
+    sa.Column('stars_1', sa.Integer(), nullable=False),
+    sa.Column('stars_2', sa.Integer(), nullable=False),
+    sa.Column('stars_3', sa.Integer(), nullable=False),
+    sa.Column('stars_4', sa.Integer(), nullable=False),
+    sa.Column('stars_5', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['movie_id'], ['movie.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('movie_id')
+    )
+
+    # a user who rated a movie more than once keeps the oldest rating, later ones stay as text reviews
+    op.execute(
+        'UPDATE review a SET stars = NULL FROM review b '
+        'WHERE a.user_id = b.user_id AND a.movie_id = b.movie_id AND a.parent_id IS NULL AND b.parent_id IS NULL '
+        'AND a.stars IS NOT NULL AND b.stars IS NOT NULL AND a.id > b.id'
+    )
+    op.create_index('uq_review_user_id_movie_id_rating', 'review', ['user_id', 'movie_id'], unique=True,
+                    postgresql_where=sa.text('parent_id IS NULL AND stars IS NOT NULL'))
+
+    op.execute(
+        'INSERT INTO movie_rating (movie_id, rating_count, rating_sum, stars_1, stars_2, stars_3, stars_4, stars_5) '
+        'SELECT movie_id, count(*), sum(stars), '
+        'count(*) FILTER (WHERE stars = 1), count(*) FILTER (WHERE stars = 2), count(*) FILTER (WHERE stars = 3), '
+        'count(*) FILTER (WHERE stars = 4), count(*) FILTER (WHERE stars = 5) '
+        'FROM review WHERE parent_id IS NULL AND stars IS NOT NULL GROUP BY movie_id'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_review_user_id_movie_id_rating', table_name='review')
+    op.drop_table('movie_rating')
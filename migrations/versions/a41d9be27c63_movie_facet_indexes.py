@@ -0,0 +1,34 @@
+"""movie facet indexes
+
+Revision ID: a41d9be27c63
+Revises: 5c2e81f0a7d4
+Create Date: 2026-10-18 11:03:17.904532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41d9be27c63'
+down_revision: Union[str, None] = '5c2e81f0a7d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_movie_type', 'movie', ['type'], unique=False, postgresql_using='gin')
+    op.create_index('ix_movie_year', 'movie', ['year'], unique=False)
+    op.create_index('ix_movie_country_id', 'movie', ['country_id'], unique=False)
+    op.create_index('ix_movie_genre_genre_id_movie_id', 'movie_genre', ['genre_id', 'movie_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_movie_genre_genre_id_movie_id', table_name='movie_genre')
+    op.drop_index('ix_movie_country_id', table_name='movie')
+    op.drop_index('ix_movie_year', table_name='movie')
+    op.drop_index('ix_movie_type', table_name='movie', postgresql_using='gin')
@@ -0,0 +1,63 @@
+"""foreign key indexes
+
+Revision ID: c7f3a9d21b58
+Revises: a41d9be27c63
+Create Date: 2026-10-18 11:48:52.117340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7f3a9d21b58'
+down_revision: Union[str, None] = 'a41d9be27c63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_moment_movie_id', 'moment', ['movie_id']),
+    ('ix_review_movie_id', 'review', ['movie_id']),
+    ('ix_review_user_id', 'review', ['user_id']),
+    ('ix_review_parent_id', 'review', ['parent_id']),
+    ('ix_favorite_item_movie_id', 'favorite_item', ['movie_id']),
+    ('ix_refresh_token_user_id', 'refresh_token', ['user_id']),
+    ('ix_movie_actor_actor_id_movie_id', 'movie_actor', ['actor_id', 'movie_id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction. A failed concurrent build leaves an
+    # INVALID index behind that if_not_exists would keep, so drop those before building again
+    with op.get_context().autocommit_block():
+        invalid = set(op.get_bind().scalars(sa.text(
+            'SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE NOT i.indisvalid AND c.relname = ANY(:names)'
+        ), {'names': [name for name, _, _ in INDEXES]}))
+        for name, table, columns in INDEXES:
+            if name in invalid:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True,
+                            if_not_exists=True)
+
+    # the cleanup and the unique index share one transaction, and the lock keeps new duplicates out
+    # between them; favorite_item only stops taking writes while its index builds
+    op.execute('LOCK TABLE favorite_item IN SHARE ROW EXCLUSIVE MODE')
+    # keep the oldest row of every duplicated (favorite_id, movie_id) pair before making it unique
+    op.execute(
+        'DELETE FROM favorite_item a USING favorite_item b '
+        'WHERE a.favorite_id = b.favorite_id AND a.movie_id = b.movie_id AND a.id > b.id'
+    )
+    op.create_unique_constraint('uq_favorite_item_favorite_id_movie_id', 'favorite_item',
+                                ['favorite_id', 'movie_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_favorite_item_favorite_id_movie_id', 'favorite_item', type_='unique')
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,34 @@
+"""drop refresh token hash
+
+Revision ID: d59e1c7a4b02
+Revises: 8b4e2f6d1a93
+Create Date: 2026-10-18 16:02:41.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd59e1c7a4b02'
+down_revision: Union[str, None] = '8b4e2f6d1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # rotation and revocation live in Redis, the session row is only keyed by its jti
+    op.drop_constraint(op.f('refresh_token_token_hash_key'), 'refresh_token', type_='unique')
+    op.drop_column('refresh_token', 'token_hash')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # the hashes are gone, so the sessions cannot be kept
+    op.execute('DELETE FROM refresh_token')
+    op.add_column('refresh_token', sa.Column('token_hash', sa.VARCHAR(length=64), autoincrement=False,
+                                             nullable=False))
+    op.create_unique_constraint(op.f('refresh_token_token_hash_key'), 'refresh_token', ['token_hash'])
@@ -0,0 +1,44 @@
+"""hashed refresh tokens
+
+Revision ID: e2b64d0c9f17
+Revises: c7f3a9d21b58
+Create Date: 2026-10-18 13:20:05.662981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b64d0c9f17'
+down_revision: Union[str, None] = 'c7f3a9d21b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # stored plaintext tokens carry no jti and cannot be refreshed any more, users log in again
+    op.execute('DELETE FROM refresh_token')
+    op.drop_column('refresh_token', 'token')
+    op.add_column('refresh_token', sa.Column('jti', sa.String(length=32), nullable=False))
+    op.add_column('refresh_token', sa.Column('token_hash', sa.String(length=64), nullable=False))
+    op.add_column('refresh_token', sa.Column('expires_at', sa.DateTime(), nullable=False))
+    op.create_unique_constraint(op.f('refresh_token_jti_key'), 'refresh_token', ['jti'])
+    op.create_unique_constraint(op.f('refresh_token_token_hash_key'), 'refresh_token', ['token_hash'])
+    op.create_index(op.f('ix_refresh_token_expires_at'), 'refresh_token', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DELETE FROM refresh_token')
+    op.drop_index(op.f('ix_refresh_token_expires_at'), table_name='refresh_token')
+    op.drop_constraint(op.f('refresh_token_token_hash_key'), 'refresh_token', type_='unique')
+    op.drop_constraint(op.f('refresh_token_jti_key'), 'refresh_token', type_='unique')
+    op.drop_column('refresh_token', 'expires_at')
+    op.drop_column('refresh_token', 'token_hash')
+    op.drop_column('refresh_token', 'jti')
+    op.add_column('refresh_token', sa.Column('token', sa.VARCHAR(), autoincrement=False, nullable=False))
+    op.create_unique_constraint('refresh_token_token_key', 'refresh_token', ['token'])
@@ -0,0 +1,40 @@
+"""name lookup indexes
+
+Revision ID: f3d8c51a6e20
+Revises: e2b64d0c9f17
+Create Date: 2026-10-18 14:05:41.309127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3d8c51a6e20'
+down_revision: Union[str, None] = 'e2b64d0c9f17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_actor_actor_name', 'actor', ['actor_name']),
+    ('ix_director_director_name', 'director', ['director_name']),
+    ('ix_genre_genre_name', 'genre', ['genre_name']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True,
+                            if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
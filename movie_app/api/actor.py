@@ -1,64 +1,72 @@
-from movie_app.db.models import Actor
-from movie_app.db.schema import ActorSchema
-from movie_app.db.database import SessionLocal
-from sqlalchemy.orm import Session
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends
+from movie_app.db.models import Actor, MovieActor
+from movie_app.db.schema import ActorSchema, Page
+from movie_app.db.database import get_db
+from movie_app.db.pagination import PageParams, paginate
+from movie_app import cache
+from movie_app.fastjson import RowSerializer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, HTTPException, Depends, Request
 
 actor_router = APIRouter(prefix='/actor', tags=['Actors'])
 
-
-async def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+ACTOR_SORT_FIELDS = {'id': Actor.id, 'actor_name': Actor.actor_name}
+ACTOR_ROWS = RowSerializer(ActorSchema, Actor)
 
 
 @actor_router.post('/', response_model=ActorSchema)
-async def actor_create(actor: ActorSchema, db: Session = Depends(get_db)):
+async def actor_create(actor: ActorSchema, db: AsyncSession = Depends(get_db)):
     actor_db = Actor(**actor.dict())
     db.add(actor_db)
-    db.commit()
-    db.refresh(actor_db)
+    await db.commit()
+    await db.refresh(actor_db)
+    await cache.invalidate(cache.list_key('actor'))
     return actor_db
 
 
-@actor_router.get('/', response_model=List[ActorSchema])
-async def actor_list(db: Session = Depends(get_db)):
-    return db.query(Actor).all()
+@actor_router.get('/', response_model=Page[ActorSchema])
+async def actor_list(request: Request, page: PageParams = Depends(), db: AsyncSession = Depends(get_db)):
+    return await cache.read_through(request, cache.list_key('actor'), Page[ActorSchema],
+                                    lambda: paginate(db, ACTOR_ROWS.select(), page, ACTOR_SORT_FIELDS, scalars=False),
+                                    field=page.cache_field, dumper=ACTOR_ROWS.dump)
 
 
 @actor_router.get('/{actor_id}/', response_model=ActorSchema)
-async def actor_detail(actor_id: int, db: Session = Depends(get_db)):
-    actor_db = db.query(Actor).filter(Actor.id == actor_id).first()
-    if actor_db is None:
-        raise HTTPException(status_code=404, detail='Actor not found')
-    return actor_db
+async def actor_detail(request: Request, actor_id: int, db: AsyncSession = Depends(get_db)):
+    async def load():
+        actor_db = await db.get(Actor, actor_id)
+        if actor_db is None:
+            raise HTTPException(status_code=404, detail='Actor not found')
+        return actor_db
+
+    return await cache.read_through(request, cache.key('actor', actor_id), ActorSchema, load)
 
 
 @actor_router.put('/{actor_id}/', response_model=ActorSchema)
-async def actor_update(actor_id: int, actor: ActorSchema, db: Session = Depends(get_db)):
-    actor_db = db.query(Actor).filter(Actor.id == actor_id).first()
+async def actor_update(actor_id: int, actor: ActorSchema, db: AsyncSession = Depends(get_db)):
+    actor_db = await db.get(Actor, actor_id)
     if actor_db is None:
         raise HTTPException(status_code=404, detail='Actor not found')
+    movie_ids = (await db.scalars(select(MovieActor.movie_id).where(MovieActor.actor_id == actor_id))).all()
 
     for actor_key, actor_value in actor.dict().items():
         setattr(actor_db, actor_key, actor_value)
 
     db.add(actor_db)
-    db.commit()
-    db.refresh(actor_db)
+    await db.commit()
+    await db.refresh(actor_db)
+    await cache.invalidate(cache.key('actor', actor_id), cache.list_key('actor'), *cache.card_keys(movie_ids))
     return actor_db
 
 
 @actor_router.delete('/{actor_id}/')
-async def actor_delete(actor_id: int, db: Session = Depends(get_db)):
-    actor_db = db.query(Actor).filter(Actor.id == actor_id).first()
+async def actor_delete(actor_id: int, db: AsyncSession = Depends(get_db)):
+    actor_db = await db.get(Actor, actor_id)
     if actor_db is None:
         raise HTTPException(status_code=404, detail='Actor not found')
 
-    db.delete(actor_db)
-    db.commit()
+    movie_ids = (await db.scalars(select(MovieActor.movie_id).where(MovieActor.actor_id == actor_id))).all()
+    await db.delete(actor_db)
+    await db.commit()
+    await cache.invalidate(cache.key('actor', actor_id), cache.list_key('actor'), *cache.card_keys(movie_ids))
     return {'message': 'Actor is deleted'}
@@ -1,55 +1,150 @@
-from movie_app.db.database import SessionLocal
-from movie_app.db.schema import UserProfileSchema
+import asyncio
+import logging
+import time
+from uuid import uuid4
+from movie_app.db.database import get_db, SessionLocal
+from movie_app.db.schema import UserProfileSchema, CurrentUserSchema
 from movie_app.db.models import UserProfile, RefreshToken, Favorite
 from fastapi import Depends, HTTPException, APIRouter
-from sqlalchemy.orm import Session
-from typing import Optional
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional, Tuple
 from datetime import timedelta, datetime
 from fastapi_limiter.depends import RateLimiter
-from movie_app.config import SECRET_KEY, REFRESH_TOKEN_EXPIRE_DAYS, ALGORITHM
-from jose import jwt
-from passlib.context import CryptContext
+from movie_app.config import SECRET_KEY, REFRESH_TOKEN_EXPIRE_DAYS, ALGORITHM, settings
+from movie_app import cache
+from jose import jwt, JWTError
+from redis.exceptions import RedisError
+from movie_app.passwords import hash_password, verify_password
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
+logger = logging.getLogger(__name__)
+
 auth_router = APIRouter(prefix='/auth', tags=['Authorization'])
 
 oauth2_schema = OAuth2PasswordBearer(tokenUrl='/auth/login/')
-password_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
-
 
-async def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+_principals: Dict[str, Tuple[float, CurrentUserSchema]] = {}
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=10))
-    to_encode.update({'exp': expire})
+    to_encode.update({'exp': expire, 'type': 'access'})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def create_refresh_token(data: dict):
-    return create_access_token(data, expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+# every refresh token has its own jti; sid is the jti of the login that started the chain,
+# and rotated tokens keep the session's original expiry
+def create_refresh_token(data: dict, session_id: Optional[str] = None, expires_at: Optional[datetime] = None):
+    jti = uuid4().hex
+    claims = {
+        **data,
+        'jti': jti,
+        'sid': session_id or jti,
+        'type': 'refresh',
+        'exp': expires_at or datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    }
+    return jwt.encode(dict(claims), SECRET_KEY, algorithm=ALGORITHM), claims
+
+
+def decode_refresh_token(token: str) -> dict:
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_error()
+    if claims.get('type') != 'refresh' or not claims.get('jti') or not claims.get('sid') or not claims.get('sub'):
+        raise credentials_error()
+    return claims
+
+
+def used_token_key(jti: str):
+    return cache.key('refresh', 'used', jti)
+
+
+def revoked_session_key(sid: str):
+    return cache.key('refresh', 'revoked', sid)
+
+
+def _remaining(claims: dict) -> int:
+    return max(int(claims['exp'] - time.time()), 1)
+
+
+async def revoke_session(claims: dict):
+    async with cache.redis.pipeline(transaction=False) as pipe:
+        pipe.set(used_token_key(claims['jti']), 1, ex=_remaining(claims))
+        pipe.set(revoked_session_key(claims['sid']), 1, ex=_remaining(claims))
+        await pipe.execute()
+
 
+def require_redis():
+    if cache.redis is None:
+        raise HTTPException(status_code=503, detail='Token store is unavailable')
 
-def verify_password(plain_password, hash_password):
-    return password_context.verify(plain_password, hash_password)
 
+def credentials_error():
+    return HTTPException(status_code=401, detail='Could not validate credentials',
+                         headers={'WWW-Authenticate': 'Bearer'})
 
-def get_password_hash(password):
-    return password_context.hash(password)
+
+async def _load_principal(username: str, db: AsyncSession) -> Optional[CurrentUserSchema]:
+    principal_key = cache.key('principal', username)
+    if cache.redis is not None:
+        try:
+            cached = await cache.redis.get(principal_key)
+        except RedisError:
+            cached = None
+        if cached is not None:
+            return CurrentUserSchema.model_validate_json(cached)
+
+    row = (await db.execute(
+        select(UserProfile.id, UserProfile.username, UserProfile.status, Favorite.id.label('favorite_id'))
+        .outerjoin(Favorite, Favorite.user_id == UserProfile.id)
+        .where(UserProfile.username == username)
+    )).first()
+    if row is None:
+        return None
+
+    principal = CurrentUserSchema.model_validate(row, from_attributes=True)
+    if cache.redis is not None:
+        try:
+            await cache.redis.set(principal_key, principal.model_dump_json(), ex=settings.PRINCIPAL_REDIS_TTL)
+        except RedisError:
+            pass
+    return principal
+
+
+async def get_current_user(token: str = Depends(oauth2_schema),
+                           db: AsyncSession = Depends(get_db)) -> CurrentUserSchema:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_error()
+    username = payload.get('sub')
+    # refresh tokens issued before rotation carry no type, so only an explicit access type is accepted
+    if not username or payload.get('type') != 'access':
+        raise credentials_error()
+
+    now = time.monotonic()
+    cached = _principals.get(username)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    principal = await _load_principal(username, db)
+    if principal is None:
+        raise credentials_error()
+    if len(_principals) >= settings.PRINCIPAL_LOCAL_MAX:
+        _principals.clear()
+    _principals[username] = (now + settings.PRINCIPAL_LOCAL_TTL, principal)
+    return principal
 
 
 @auth_router.post('/register/')
-async def register(user: UserProfileSchema, db: Session = Depends(get_db)):
-    user_db = db.query(UserProfile).filter(UserProfile.username == user.username).first()
+async def register(user: UserProfileSchema, db: AsyncSession = Depends(get_db)):
+    user_db = await db.scalar(select(UserProfile).where(UserProfile.username == user.username))
     if user_db:
         raise HTTPException(status_code=400, detail='Username is already taken')
-    new_hash_pass = get_password_hash(user.password)
+    new_hash_pass = await hash_password(user.password)
     new_user = UserProfile(
         first_name=user.first_name,
         username=user.username,
@@ -60,48 +155,95 @@ async def register(user: UserProfileSchema, db: Session = Depends(get_db)):
         hashed_password=new_hash_pass,
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     favorite_db = Favorite(user_id=new_user.id)
     db.add(favorite_db)
-    db.commit()
+    await db.commit()
 
     return {'message': 'Saved'}
 
 
 @auth_router.post('/login/', dependencies=[Depends(RateLimiter(times=3, seconds=5))])
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(UserProfile).filter(UserProfile.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(UserProfile).where(UserProfile.username == form_data.username))
+    if not user:
+        raise HTTPException(status_code=401, detail='Wrong data')
+    verified, new_hash = await verify_password(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(status_code=401, detail='Wrong data')
+    if new_hash:
+        user.hashed_password = new_hash
     access_token = create_access_token({'sub': user.username})
-    refresh_token = create_refresh_token({'sub': user.username})
-    token_db = RefreshToken(token=refresh_token, user_id=user.id)
+    refresh_token, claims = create_refresh_token({'sub': user.username})
+    token_db = RefreshToken(jti=claims['jti'], expires_at=claims['exp'], user_id=user.id)
     db.add(token_db)
-    db.commit()
+    await db.commit()
     return {'access_token': access_token, 'refresh_token': refresh_token, 'token_type': 'bearer'}
 
 
 @auth_router.post('/logout/')
-async def logout(refresh_token: str, db: Session = Depends(get_db)):
-    stored_token = db.query(RefreshToken).filter(RefreshToken.token == refresh_token).first()
-    if not stored_token:
+async def logout(refresh_token: str, db: AsyncSession = Depends(get_db)):
+    claims = decode_refresh_token(refresh_token)
+    require_redis()
+    try:
+        await revoke_session(claims)
+    except RedisError:
+        raise HTTPException(status_code=503, detail='Token store is unavailable')
+
+    result = await db.execute(delete(RefreshToken).where(RefreshToken.jti == claims['sid'])
+                              .execution_options(synchronize_session=False))
+    await db.commit()
+    if not result.rowcount:
         raise HTTPException(status_code=404, detail='Refresh token not found')
-
-    db.delete(stored_token)
-    db.commit()
     return {'message': 'u are out'}
 
 
 @auth_router.post('/refresh/')
-async def refresh(refresh_token: str, db: Session = Depends(get_db)):
-    token_entry = db.query(RefreshToken).filter(RefreshToken.token == refresh_token).first()
-    if not token_entry:
-        raise HTTPException(status_code=404, detail='Token not found')
-
-    access_token = create_access_token({'sub': token_entry.user_id})
-
-    return {'access_token': access_token, 'token_type': 'bearer'}
-
-
+async def refresh(refresh_token: str):
+    claims = decode_refresh_token(refresh_token)
+    require_redis()
+    try:
+        # marking the jti as used is also the revocation check: only the first caller gets True
+        async with cache.redis.pipeline(transaction=False) as pipe:
+            pipe.set(used_token_key(claims['jti']), 1, ex=_remaining(claims), nx=True)
+            pipe.exists(revoked_session_key(claims['sid']))
+            first_use, session_revoked = await pipe.execute()
+        if not first_use and not session_revoked:
+            # a rotated token came back, so it may have leaked: end the whole session
+            await revoke_session(claims)
+    except RedisError:
+        raise HTTPException(status_code=503, detail='Token store is unavailable')
+    if not first_use or session_revoked:
+        raise credentials_error()
+
+    new_refresh_token, _ = create_refresh_token({'sub': claims['sub']}, session_id=claims['sid'],
+                                                expires_at=datetime.utcfromtimestamp(claims['exp']))
+    access_token = create_access_token({'sub': claims['sub']})
+    return {'access_token': access_token, 'refresh_token': new_refresh_token, 'token_type': 'bearer'}
+
+
+async def sweep_expired_refresh_tokens():
+    deleted = 0
+    while True:
+        async with SessionLocal() as db:
+            expired = (select(RefreshToken.id).where(RefreshToken.expires_at < datetime.utcnow())
+                       .limit(settings.REFRESH_SWEEP_BATCH).with_for_update(skip_locked=True))
+            result = await db.execute(delete(RefreshToken).where(RefreshToken.id.in_(expired))
+                                      .execution_options(synchronize_session=False))
+            await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < settings.REFRESH_SWEEP_BATCH:
+            return deleted
+
+
+async def refresh_token_sweeper():
+    while True:
+        try:
+            deleted = await sweep_expired_refresh_tokens()
+            if deleted:
+                logger.info('Deleted %s expired refresh tokens', deleted)
+        except Exception:
+            logger.exception('Refresh token sweep failed')
+        await asyncio.sleep(settings.REFRESH_SWEEP_INTERVAL)
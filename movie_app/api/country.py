@@ -1,63 +1,69 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from movie_app.db.schema import CountrySchema
-from movie_app.db.models import Country
-from movie_app.db.database import SessionLocal
-
-
-async def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from movie_app.db.schema import CountrySchema, Page
+from movie_app.db.models import Country, Movie
+from movie_app.db.database import get_db
+from movie_app.db.pagination import PageParams, paginate_rows
+from movie_app import cache, reference
 
 
 country_router = APIRouter(prefix='/country', tags=['Countries'])
 
+COUNTRY_SORT_FIELDS = {'id': Country.id, 'country_name': Country.country_name}
+
 
 @country_router.post('/', response_model=CountrySchema)
-async def country_create(country: CountrySchema, db: Session = Depends(get_db)):
+async def country_create(country: CountrySchema, db: AsyncSession = Depends(get_db)):
     country_db = Country(country_name=country.country_name)
     db.add(country_db)
-    db.commit()
-    db.refresh(country_db)
+    await db.commit()
+    await db.refresh(country_db)
+    await reference.countries.invalidate()
     return country_db
 
 
-@country_router.get('/', response_model=List[CountrySchema])
-async def country_list(db: Session = Depends(get_db)):
-    return db.query(Country).all()
+@country_router.get('/', response_model=Page[CountrySchema])
+async def country_list(request: Request, page: PageParams = Depends()):
+    rows = await reference.countries.all()
+    return cache.conditional_response(request, reference.countries.page_etag(page), Page[CountrySchema],
+                                      lambda: paginate_rows(rows, page, COUNTRY_SORT_FIELDS))
 
 
 @country_router.get('/{country_id}/', response_model=CountrySchema)
-async def country_detail(country_id: int, db: Session = Depends(get_db)):
-    country_db = db.query(Country).filter(Country.id == country_id).first()
+async def country_detail(request: Request, country_id: int):
+    country_db = await reference.countries.get(country_id)
     if country_db is None:
         raise HTTPException(status_code=404, detail='Country not found')
-    return country_db
+    return cache.conditional_response(request, reference.countries.row_etag(country_id), CountrySchema, country_db)
 
 
 @country_router.put('/{country_id}/', response_model=CountrySchema)
-async def country_update(country_id: int, country: CountrySchema, db: Session = Depends(get_db)):
-    country_db = db.query(Country).filter(Country.id == country_id).first()
+async def country_update(country_id: int, country: CountrySchema, db: AsyncSession = Depends(get_db)):
+    country_db = await db.get(Country, country_id)
     if country_db is None:
         raise HTTPException(status_code=404, detail='Country not found')
+    movie_ids = (await db.scalars(select(Movie.id).where(Movie.country_id == country_id))).all()
 
     country_db.country_name = country.country_name
     db.add(country_db)
-    db.commit()
-    db.refresh(country_db)
+    await db.commit()
+    await db.refresh(country_db)
+    await reference.countries.invalidate()
+    await cache.invalidate(*cache.card_keys(movie_ids))
     return country_db
 
 
 @country_router.delete('/{country_id}/')
-async def country_delete(country_id: int, db: Session = Depends(get_db)):
-    country_db = db.query(Country).filter(Country.id == country_id).first()
+async def country_delete(country_id: int, db: AsyncSession = Depends(get_db)):
+    country_db = await db.get(Country, country_id)
     if country_db is None:
         raise HTTPException(status_code=404, detail='Counry not found')
 
-    db.delete(country_db)
-    db.commit()
+    movie_ids = (await db.scalars(select(Movie.id).where(Movie.country_id == country_id))).all()
+    await db.delete(country_db)
+    await db.commit()
+    await reference.countries.invalidate()
+    await cache.invalidate(*cache.card_keys(movie_ids),
+                           *[cache.key('movie', movie_id) for movie_id in movie_ids], cache.list_key('movie'))
     return {'message': 'This country is deleted'}
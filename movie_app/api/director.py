@@ -1,65 +1,75 @@
-from movie_app.db.models import Director
-from movie_app.db.schema import DirectorSchema
-from movie_app.db.database import SessionLocal
-from sqlalchemy.orm import Session
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from movie_app.db.models import Director, Movie
+from movie_app.db.schema import DirectorSchema, Page
+from movie_app.db.database import get_db
+from movie_app.db.pagination import PageParams, paginate
+from movie_app import cache
+from movie_app.fastjson import RowSerializer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, HTTPException, Request
 
 
 director_router = APIRouter(prefix='/director', tags=['Directors'])
 
-
-async def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+DIRECTOR_SORT_FIELDS = {'id': Director.id, 'director_name': Director.director_name}
+DIRECTOR_ROWS = RowSerializer(DirectorSchema, Director)
 
 
 @director_router.post('/', response_model=DirectorSchema)
-async def director_create(director: DirectorSchema, db: Session = Depends(get_db)):
+async def director_create(director: DirectorSchema, db: AsyncSession = Depends(get_db)):
     director_db = Director(**director.dict())
     db.add(director_db)
-    db.commit()
-    db.refresh(director_db)
+    await db.commit()
+    await db.refresh(director_db)
+    await cache.invalidate(cache.list_key('director'))
     return director_db
 
 
-@director_router.get('/', response_model=List[DirectorSchema])
-async def director_list(db: Session = Depends(get_db)):
-    return db.query(Director).all()
+@director_router.get('/', response_model=Page[DirectorSchema])
+async def director_list(request: Request, page: PageParams = Depends(), db: AsyncSession = Depends(get_db)):
+    return await cache.read_through(request, cache.list_key('director'), Page[DirectorSchema],
+                                    lambda: paginate(db, DIRECTOR_ROWS.select(), page, DIRECTOR_SORT_FIELDS,
+                                                     scalars=False),
+                                    field=page.cache_field, dumper=DIRECTOR_ROWS.dump)
 
 
 @director_router.get('/{director_id}/', response_model=DirectorSchema)
-async def director_detail(director_id: int, db: Session = Depends(get_db)):
-    director_db = db.query(Director).filter(Director.id == director_id).first()
-    if director_db is None:
-        raise HTTPException(status_code=404, detail='Director not found')
-    return director_db
+async def director_detail(request: Request, director_id: int, db: AsyncSession = Depends(get_db)):
+    async def load():
+        director_db = await db.get(Director, director_id)
+        if director_db is None:
+            raise HTTPException(status_code=404, detail='Director not found')
+        return director_db
+
+    return await cache.read_through(request, cache.key('director', director_id), DirectorSchema, load)
 
 
 @director_router.put('/{director_id}/', response_model=DirectorSchema)
-async def director_update(director_id: int, director: DirectorSchema, db: Session = Depends(get_db)):
-    director_db = db.query(Director).filter(Director.id == director_id).first()
+async def director_update(director_id: int, director: DirectorSchema, db: AsyncSession = Depends(get_db)):
+    director_db = await db.get(Director, director_id)
     if director_db is None:
         raise HTTPException(status_code=404, detail='Director not found')
+    movie_ids = (await db.scalars(select(Movie.id).where(Movie.director_id == director_id))).all()
 
     for director_key, director_value in director.dict().items():
         setattr(director_db, director_key, director_value)
 
     db.add(director_db)
-    db.commit()
-    db.refresh(director_db)
+    await db.commit()
+    await db.refresh(director_db)
+    await cache.invalidate(cache.key('director', director_id), cache.list_key('director'), *cache.card_keys(movie_ids))
     return director_db
 
 
 @director_router.delete('/{director_id}/')
-async def director_delete(director_id: int, db: Session = Depends(get_db)):
-    director_db = db.query(Director).filter(Director.id == director_id).first()
+async def director_delete(director_id: int, db: AsyncSession = Depends(get_db)):
+    director_db = await db.get(Director, director_id)
     if director_db is None:
         raise HTTPException(status_code=404, detail='Director not found')
 
-    db.delete(director_db)
-    db.commit()
-    return {'message': 'Director is deleted'}
\ No newline at end of file
+    movie_ids = (await db.scalars(select(Movie.id).where(Movie.director_id == director_id))).all()
+    await db.delete(director_db)
+    await db.commit()
+    await cache.invalidate(cache.key('director', director_id), cache.list_key('director'), *cache.card_keys(movie_ids),
+                           *[cache.key('movie', movie_id) for movie_id in movie_ids], cache.list_key('movie'))
+    return {'message': 'Director is deleted'}
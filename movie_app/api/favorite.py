@@ -1,63 +1,202 @@
-from movie_app.db.models import Favorite, UserProfile, Movie, FavoriteItem
-from movie_app.db.schema import FavoriteItemSchema, FavoriteItemCreateSchema, FavoriteSchema
-from movie_app.db.database import SessionLocal
-from sqlalchemy.orm import Session
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from movie_app.db.models import Movie, FavoriteItem
+from movie_app.db.schema import (CurrentUserSchema, FavoriteBatchSchema, FavoriteBatchResultSchema, FavoriteMovieSchema,
+                                 Page)
+from movie_app.db.database import get_db
+from movie_app.db.pagination import PageParams, paginate
+from movie_app.db.filters import genre_names
+from movie_app.api.auth import get_current_user
+from movie_app.config import settings
+from movie_app import cache, leaderboard
+from redis.exceptions import RedisError
+from sqlalchemy import select, delete, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from functools import lru_cache
+from typing import Dict, List, Union
+from fastapi import APIRouter, Depends, HTTPException, Query
 
 favorite_router = APIRouter(prefix='/favorite', tags=['Favorite'])
 
+FAVORITE_ITEM_UNIQUE = 'uq_favorite_item_favorite_id_movie_id'
 
-async def get_db():
-    db = SessionLocal()
+# id is the favorite item, so the default order is the order movies were added in
+FAVORITE_SORT_FIELDS = {'id': FavoriteItem.id, 'movie_name': Movie.movie_name, 'year': Movie.year}
+FAVORITE_ID_SORT_FIELDS = {'id': FavoriteItem.id}
+
+# the set always holds this member, so an empty favorite list still exists in Redis;
+# it is not an integer, so no movie_id a client sends can match it
+FAVORITE_SET_SENTINEL = '_'
+
+# adds only to a set that is already built: a partial set would answer "not favorited" for the rest
+SADD_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('SADD', KEYS[1], unpack(ARGV))
+end
+return 0
+"""
+
+
+def favorite_set_key(favorite_id: int):
+    return cache.key('favorite', favorite_id, 'movie_ids')
+
+
+def favorite_version_key(favorite_id: int):
+    return cache.key('favorite', favorite_id, 'version')
+
+
+@lru_cache(maxsize=1)
+def _sadd_if_exists(client):
+    return client.register_script(SADD_IF_EXISTS)
+
+
+async def mirror_favorites(favorite_id: int, added=(), removed=()):
+    if cache.redis is None or not (added or removed):
+        return
+    key = favorite_set_key(favorite_id)
     try:
-        yield db
-    finally:
-        db.close()
+        # bumped before the set changes, so a rebuild that read the table earlier won't overwrite it
+        async with cache.redis.pipeline(transaction=False) as pipe:
+            pipe.incr(favorite_version_key(favorite_id))
+            pipe.expire(favorite_version_key(favorite_id), settings.FAVORITE_SET_TTL)
+            await pipe.execute()
+        if added:
+            await _sadd_if_exists(cache.redis)(keys=[key], args=list(added))
+        if removed:
+            await cache.redis.srem(key, *removed)
+    except RedisError:
+        # the set may now be wrong, drop it and let the next check rebuild it
+        await cache.invalidate(key)
+
+
+async def favorite_flags(db: AsyncSession, favorite_id: int, movie_ids: List[int]) -> List[bool]:
+    key, version_key = favorite_set_key(favorite_id), favorite_version_key(favorite_id)
+    version = None
+    if cache.redis is not None:
+        try:
+            async with cache.redis.pipeline(transaction=False) as pipe:
+                pipe.exists(key)
+                pipe.smismember(key, movie_ids)
+                pipe.get(version_key)
+                exists, flags, version = await pipe.execute()
+            if exists:
+                return [bool(flag) for flag in flags]
+        except RedisError:
+            pass
 
+    favorited = set((await db.scalars(select(FavoriteItem.movie_id)
+                                      .where(FavoriteItem.favorite_id == favorite_id))).all())
+    if cache.redis is not None:
+        try:
+            # a write that committed after the read above has bumped the version: its SADD found no set
+            # to add to, and writing this snapshot would hide it, so leave the set for the next check
+            async with cache.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(version_key)
+                if await pipe.get(version_key) == version:
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.sadd(key, FAVORITE_SET_SENTINEL, *favorited)
+                    pipe.expire(key, settings.FAVORITE_SET_TTL)
+                    await pipe.execute()
+        except RedisError:
+            pass
+    return [movie_id in favorited for movie_id in movie_ids]
 
-@favorite_router.get('/', response_model=FavoriteSchema)
-async def favorite_list(user_id: int, db: Session = Depends(get_db)):
-    favorite_db = db.query(Favorite).filter(Favorite.user_id == user_id).first()
-    if not favorite_db:
+
+# ids_only pages bare movie ids for clients that keep their own copy of the movies
+@favorite_router.get('/', response_model=Union[Page[FavoriteMovieSchema], Page[int]])
+async def favorite_list(ids_only: bool = False, page: PageParams = Depends(),
+                        current_user: CurrentUserSchema = Depends(get_current_user),
+                        db: AsyncSession = Depends(get_db)):
+    if current_user.favorite_id is None:
         raise HTTPException(status_code=404, detail='Favorite not found')
 
-    return favorite_db
+    if ids_only:
+        query = (select(FavoriteItem.id, FavoriteItem.movie_id)
+                 .where(FavoriteItem.favorite_id == current_user.favorite_id))
+        result = await paginate(db, query, page, FAVORITE_ID_SORT_FIELDS, scalars=False)
+        return {**result, 'items': [row.movie_id for row in result['items']]}
 
+    query = (select(FavoriteItem.id, FavoriteItem.movie_id, Movie.movie_name, Movie.movie_image, Movie.year,
+                    genre_names().label('genre'))
+             .join(Movie, Movie.id == FavoriteItem.movie_id)
+             .where(FavoriteItem.favorite_id == current_user.favorite_id))
+    return await paginate(db, query, page, FAVORITE_SORT_FIELDS, scalars=False)
 
-@favorite_router.post('/')
-async def favorite_add(movie_id: int, user_id: int, db: Session = Depends(get_db)):
-    movie_db = db.query(Movie).filter(Movie.id == movie_id).first()
-    if not movie_db:
-        raise HTTPException(status_code=404, detail='Movie not found')
 
-    favorite_db = db.query(Favorite).filter(Favorite.user_id == user_id).first()
-    if not favorite_db:
+@favorite_router.get('/check/', response_model=Dict[int, bool])
+async def favorite_check(movie_id: List[int] = Query(..., max_length=500),
+                         current_user: CurrentUserSchema = Depends(get_current_user),
+                         db: AsyncSession = Depends(get_db)):
+    if current_user.favorite_id is None:
+        return {movie: False for movie in movie_id}
+    return dict(zip(movie_id, await favorite_flags(db, current_user.favorite_id, movie_id)))
+
+
+@favorite_router.post('/')
+async def favorite_add(movie_id: int, current_user: CurrentUserSchema = Depends(get_current_user),
+                       db: AsyncSession = Depends(get_db)):
+    if current_user.favorite_id is None:
         raise HTTPException(status_code=404, detail='User not found')
 
-    movie_item = db.query(FavoriteItem).filter(FavoriteItem.favorite_id == favorite_db.id,
-                                               FavoriteItem.movie_id == movie_id).first()
-    if movie_item:
+    # one round trip: the unique pair answers "already there", the foreign key answers "no such movie"
+    try:
+        favorite_item_db = (await db.execute(
+            insert(FavoriteItem).values(favorite_id=current_user.favorite_id, movie_id=movie_id)
+            .on_conflict_do_nothing(constraint=FAVORITE_ITEM_UNIQUE)
+            .returning(FavoriteItem.id, FavoriteItem.favorite_id, FavoriteItem.movie_id))).first()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail='Movie not found')
+    if favorite_item_db is None:
         raise HTTPException(status_code=400, detail='Movie already exists in favorite')
 
-    favorite_item_db = FavoriteItem(favorite_id=favorite_db.id, movie_id=movie_id)
-    db.add(favorite_item_db)
-    db.commit()
-    db.refresh(favorite_item_db)
-    return favorite_item_db
+    await db.commit()
+    await mirror_favorites(current_user.favorite_id, added=[movie_id])
+    await leaderboard.record([movie_id], leaderboard.FAVORITE_WEIGHT)
+    return favorite_item_db._asdict()
+
+
+@favorite_router.post('/batch/', response_model=FavoriteBatchResultSchema)
+async def favorite_batch(batch: FavoriteBatchSchema, current_user: CurrentUserSchema = Depends(get_current_user),
+                         db: AsyncSession = Depends(get_db)):
+    if current_user.favorite_id is None:
+        raise HTTPException(status_code=404, detail='Favorite not found')
+
+    # unknown movies and pairs that are already there are skipped, the response lists what changed
+    added, removed = [], []
+    if batch.add:
+        added = (await db.scalars(
+            insert(FavoriteItem)
+            .from_select(['favorite_id', 'movie_id'],
+                         select(literal(current_user.favorite_id), Movie.id).where(Movie.id.in_(set(batch.add))))
+            .on_conflict_do_nothing(constraint=FAVORITE_ITEM_UNIQUE)
+            .returning(FavoriteItem.movie_id))).all()
+    if batch.remove:
+        removed = (await db.scalars(
+            delete(FavoriteItem)
+            .where(FavoriteItem.favorite_id == current_user.favorite_id, FavoriteItem.movie_id.in_(set(batch.remove)))
+            .returning(FavoriteItem.movie_id))).all()
+    await db.commit()
+    await mirror_favorites(current_user.favorite_id, added=added, removed=removed)
+    await leaderboard.record(added, leaderboard.FAVORITE_WEIGHT)
+    await leaderboard.record(removed, -leaderboard.FAVORITE_WEIGHT)
+    return {'added': sorted(added), 'removed': sorted(removed)}
 
 
 @favorite_router.delete('/{movie_id}/')
-async def movie_delete(movie_id: int, user_id: int, db: Session = Depends(get_db)):
-    favorite_db = db.query(Favorite).filter(Favorite.user_id == user_id).first()
-    if not favorite_db:
+async def movie_delete(movie_id: int, current_user: CurrentUserSchema = Depends(get_current_user),
+                       db: AsyncSession = Depends(get_db)):
+    if current_user.favorite_id is None:
         raise HTTPException(status_code=404, detail='Favorite not found')
 
-    favorite_item_db = db.query(FavoriteItem).filter(FavoriteItem.favorite_id == favorite_db.id,
-                                                     FavoriteItem.movie_id == movie_id).first()
-    if not favorite_item_db:
+    deleted = await db.scalar(delete(FavoriteItem).where(FavoriteItem.favorite_id == current_user.favorite_id,
+                                                         FavoriteItem.movie_id == movie_id)
+                              .returning(FavoriteItem.id))
+    if deleted is None:
         raise HTTPException(status_code=404, detail='Favorite item not found')
 
-    db.delete(favorite_item_db)
-    db.commit()
+    await db.commit()
+    await mirror_favorites(current_user.favorite_id, removed=[movie_id])
+    await leaderboard.record([movie_id], -leaderboard.FAVORITE_WEIGHT)
     return {'message': 'Movie is deleted'}
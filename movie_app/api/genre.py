@@ -1,64 +1,69 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.testing.config import db_url
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 
-from movie_app.db.models import Genre
-from movie_app.db.schema import GenreSchema
-from movie_app.db.database import SessionLocal
-from sqlalchemy.orm import Session
-from typing import List
+from movie_app.db.models import Genre, MovieGenre
+from movie_app.db.schema import GenreSchema, Page
+from movie_app.db.database import get_db
+from movie_app.db.pagination import PageParams, paginate_rows
+from movie_app import cache, reference
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 genre_router = APIRouter(prefix='/genre', tags=['Genres'])
 
-async def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+GENRE_SORT_FIELDS = {'id': Genre.id, 'genre_name': Genre.genre_name}
 
 
 @genre_router.post('/', response_model=GenreSchema)
-async def genre_create(genre: GenreSchema, db: Session = Depends(get_db)):
+async def genre_create(genre: GenreSchema, db: AsyncSession = Depends(get_db)):
     genre_db = Genre(genre_name=genre.genre_name)
     db.add(genre_db)
-    db.commit()
-    db.refresh(genre_db)
+    await db.commit()
+    await db.refresh(genre_db)
+    await reference.genres.invalidate()
     return genre_db
 
 
-@genre_router.get('/', response_model=List[GenreSchema])
-async def genre_list(db: Session = Depends(get_db)):
-    return db.query(Genre).all()
+@genre_router.get('/', response_model=Page[GenreSchema])
+async def genre_list(request: Request, page: PageParams = Depends()):
+    rows = await reference.genres.all()
+    return cache.conditional_response(request, reference.genres.page_etag(page), Page[GenreSchema],
+                                      lambda: paginate_rows(rows, page, GENRE_SORT_FIELDS))
 
 
 @genre_router.get('/{genre_id}/', response_model=GenreSchema)
-async def genre_detail(genre_id: int, db: Session = Depends(get_db)):
-    genre_db = db.query(Genre).filter(Genre.id == genre_id).first()
+async def genre_detail(request: Request, genre_id: int):
+    genre_db = await reference.genres.get(genre_id)
     if genre_db is None:
         raise HTTPException(status_code=404, detail='Genre not found')
-    return genre_db
+    return cache.conditional_response(request, reference.genres.row_etag(genre_id), GenreSchema, genre_db)
 
 
 @genre_router.put('/{genre_id}/', response_model=GenreSchema)
-async def genre_update(genre_id: int, genre: GenreSchema, db: Session = Depends(get_db)):
-    genre_db = db.query(Genre).filter(Genre.id == genre_id).first()
+async def genre_update(genre_id: int, genre: GenreSchema, db: AsyncSession = Depends(get_db)):
+    genre_db = await db.get(Genre, genre_id)
     if genre_db is None:
         raise HTTPException(status_code=404, detail='Genre not found')
+    movie_ids = (await db.scalars(select(MovieGenre.movie_id).where(MovieGenre.genre_id == genre_id))).all()
 
     genre_db.genre_name = genre.genre_name
     db.add(genre_db)
-    db.commit()
-    db.refresh(genre_db)
+    await db.commit()
+    await db.refresh(genre_db)
+    await reference.genres.invalidate()
+    await cache.invalidate(*cache.card_keys(movie_ids))
     return genre_db
 
 
 @genre_router.delete('/{genre_id}/')
-async def genre_delete(genre_id: int, db: Session = Depends(get_db)):
-    genre_db = db.query(Genre).filter(Genre.id == genre_id).first()
+async def genre_delete(genre_id: int, db: AsyncSession = Depends(get_db)):
+    genre_db = await db.get(Genre, genre_id)
     if genre_db is None:
         raise HTTPException(status_code=404, detail='Genre not found')
 
-    db.delete(genre_db)
-    db.commit()
+    movie_ids = (await db.scalars(select(MovieGenre.movie_id).where(MovieGenre.genre_id == genre_id))).all()
+    await db.delete(genre_db)
+    await db.commit()
+    await reference.genres.invalidate()
+    await cache.invalidate(*cache.card_keys(movie_ids), cache.list_key('movie'))
     return {'message': 'Genre is deleted'}
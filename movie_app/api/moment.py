@@ -1,64 +1,65 @@
 from movie_app.db.models import Moment
-from movie_app.db.schema import MomentSchema
-from movie_app.db.database import SessionLocal
-from sqlalchemy.orm import Session
-from typing import List
+from movie_app.db.schema import MomentSchema, Page
+from movie_app.db.database import get_db
+from movie_app import cache
+from movie_app.fastjson import RowSerializer
+from movie_app.db.pagination import PageParams, paginate
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, HTTPException
 
 moment_router = APIRouter(prefix='/moment', tags=['Moments'])
 
-
-async def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+MOMENT_SORT_FIELDS = {'id': Moment.id}
+MOMENT_ROWS = RowSerializer(MomentSchema, Moment)
 
 
 @moment_router.post('/', response_model=MomentSchema)
-async def moment_create(moment: MomentSchema, db: Session = Depends(get_db)):
+async def moment_create(moment: MomentSchema, db: AsyncSession = Depends(get_db)):
     moment_db = Moment(**moment.dict())
     db.add(moment_db)
-    db.commit()
-    db.refresh(moment_db)
+    await db.commit()
+    await db.refresh(moment_db)
+    await cache.invalidate(*cache.card_keys([moment_db.movie_id]))
     return moment_db
 
 
-@moment_router.get('/', response_model=List[MomentSchema])
-async def moment_list(db: Session = Depends(get_db)):
-    return db.query(Moment).all()
+@moment_router.get('/', response_model=Page[MomentSchema])
+async def moment_list(page: PageParams = Depends(), db: AsyncSession = Depends(get_db)):
+    return MOMENT_ROWS.response(await paginate(db, MOMENT_ROWS.select(), page, MOMENT_SORT_FIELDS, scalars=False))
 
 
 @moment_router.get('/{moment_id}/', response_model=MomentSchema)
-async def moment_detail(moment_id: int, db: Session = Depends(get_db)):
-    moment_db = db.query(Moment).filter(Moment.id == moment_id).first()
+async def moment_detail(moment_id: int, db: AsyncSession = Depends(get_db)):
+    moment_db = await db.get(Moment, moment_id)
     if moment_db is None:
         raise HTTPException(status_code=404, detail='Moment not found')
     return moment_db
 
 
 @moment_router.put('/{moment_id}/', response_model=MomentSchema)
-async def moment_update(moment_id: int, moment: MomentSchema, db: Session = Depends(get_db)):
-    moment_db = db.query(Moment).filter(Moment.id == moment_id).first()
+async def moment_update(moment_id: int, moment: MomentSchema, db: AsyncSession = Depends(get_db)):
+    moment_db = await db.get(Moment, moment_id)
     if moment_db is None:
         raise HTTPException(status_code=404, detail='Moment not found')
+    movie_ids = {moment_db.movie_id, moment.movie_id}
 
     for moment_key, moment_value in moment.dict().items():
         setattr(moment_db, moment_key, moment_value)
 
     db.add(moment_db)
-    db.commit()
-    db.refresh(moment_db)
+    await db.commit()
+    await db.refresh(moment_db)
+    await cache.invalidate(*cache.card_keys(movie_ids))
     return moment_db
 
 
 @moment_router.delete('/{moment_id}/')
-async def moment_delete(moment_id: int, db: Session = Depends(get_db)):
-    moment_db = db.query(Moment).filter(Moment.id == moment_id).first()
+async def moment_delete(moment_id: int, db: AsyncSession = Depends(get_db)):
+    moment_db = await db.get(Moment, moment_id)
     if moment_db is None:
         raise HTTPException(status_code=404, detail='Moment not found')
 
-    db.delete(moment_db)
-    db.commit()
+    await db.delete(moment_db)
+    await db.commit()
+    await cache.invalidate(*cache.card_keys([moment_db.movie_id]))
     return {'message': 'Moment is deleted'}
@@ -1,46 +1,176 @@
-from movie_app.db.models import Movie
-from movie_app.db.schema import MovieSchema
-from movie_app.db.database import SessionLocal
-from sqlalchemy.orm import Session
+from movie_app.db.models import Movie, Review
+from movie_app.db.schema import (MovieSchema, MovieCardSchema, MovieFacetsSchema, MovieImportResultSchema,
+                                 RankedMovieSchema, Page)
+from movie_app.db.database import get_db
+from movie_app.db.pagination import PageParams, paginate, encode_cursor, decode_cursor
+from movie_app.db.filters import MovieFilterParams, facet_count_query
+from movie_app import cache, bulk_import, bulk_export, similar, leaderboard
+from movie_app.fastjson import RowSerializer
+from movie_app.config import settings
+from sqlalchemy import select, func, tuple_, Float
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
 
 movie_router = APIRouter(prefix='/movie', tags=['Movies'])
 
+MOVIE_SORT_FIELDS = {'id': Movie.id, 'movie_name': Movie.movie_name, 'year': Movie.year}
+MOVIE_ROWS = RowSerializer(MovieSchema, Movie)
 
-async def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# one query for movie + country + director + rating, one per collection, one for the reviews: 5 in total
+MOVIE_CARD_OPTIONS = (
+    joinedload(Movie.country),
+    joinedload(Movie.director),
+    joinedload(Movie.rating),
+    selectinload(Movie.actor),
+    selectinload(Movie.genre),
+    selectinload(Movie.movie_moment),
+)
+
+
+async def load_card(db: AsyncSession, movie_id: int):
+    movie_db = await db.scalar(select(Movie).options(*MOVIE_CARD_OPTIONS).where(Movie.id == movie_id))
+    if movie_db is None:
+        return None
+    # only the latest top-level reviews go into the cached card, the rest is paged by /review/threads/
+    reviews = await db.scalars(select(Review).where(Review.movie_id == movie_id, Review.parent_id.is_(None))
+                               .order_by(Review.id.desc()).limit(settings.CARD_REVIEWS))
+    set_committed_value(movie_db, 'movie_review', reviews.all())
+    return movie_db
 
 
 @movie_router.post('/', response_model=MovieSchema)
-async def movie_create(movie: MovieSchema, db: Session = Depends(get_db)):
+async def movie_create(movie: MovieSchema, db: AsyncSession = Depends(get_db)):
     movie_db = Movie(**movie.dict())
     db.add(movie_db)
-    db.commit()
-    db.refresh(movie_db)
+    await db.commit()
+    await db.refresh(movie_db)
+    await cache.invalidate(cache.list_key('movie'))
+    await similar.refresh_movies(db, [movie_db.id])
     return movie_db
 
 
-@movie_router.get('/', response_model=List[MovieSchema])
-async def movie_list(db: Session = Depends(get_db)):
-    return db.query(Movie).all()
+# streams the request body, rows are validated and written in batches of IMPORT_BATCH_SIZE
+@movie_router.post('/import/', response_model=MovieImportResultSchema)
+async def movie_import(request: Request, format: str = Query('ndjson', pattern='^(ndjson|csv)$')):
+    return await bulk_import.import_movies(bulk_import.parse_records(request.stream(), format))
+
+
+@movie_router.get('/', response_model=Page[MovieSchema])
+async def movie_list(request: Request, page: PageParams = Depends(), filters: MovieFilterParams = Depends(),
+                     db: AsyncSession = Depends(get_db)):
+    return await cache.read_through(request, cache.list_key('movie'), Page[MovieSchema],
+                                    lambda: paginate(db, MOVIE_ROWS.select().where(*filters.clauses()), page,
+                                                     MOVIE_SORT_FIELDS, scalars=False),
+                                    field=f'{page.cache_field}:{filters.cache_field}', dumper=MOVIE_ROWS.dump)
+
+
+@movie_router.get('/facets/', response_model=MovieFacetsSchema)
+async def movie_facets(request: Request, filters: MovieFilterParams = Depends(), db: AsyncSession = Depends(get_db)):
+    async def load():
+        facets = {'genre': {}, 'country': {}, 'status_movie': {}, 'type': {}}
+        for facet, value, total in (await db.execute(facet_count_query(filters))).all():
+            facets[facet][value] = total
+        return facets
+
+    return await cache.read_through(request, cache.list_key('movie'), MovieFacetsSchema, load,
+                                    field=f'facets:{filters.cache_field}')
+
+
+@movie_router.get('/search/', response_model=Page[MovieSchema])
+async def movie_search(q: str = Query(..., min_length=1, max_length=200), page: PageParams = Depends(),
+                       db: AsyncSession = Depends(get_db)):
+    ts_query = func.websearch_to_tsquery('simple', q)
+    rank = func.ts_rank_cd(Movie.search_vector, ts_query, type_=Float).label('rank')
+    query = select(Movie, rank).where(Movie.search_vector.op('@@')(ts_query))
+    if page.cursor:
+        query = query.where(tuple_(rank, Movie.id) < tuple(decode_cursor(page.cursor, [rank, Movie.id])))
+    query = query.order_by(rank.desc(), Movie.id.desc()).limit(page.limit + 1)
+
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = encode_cursor([rows[-1].rank, rows[-1].Movie.id])
+    return {'items': [row.Movie for row in rows], 'next_cursor': next_cursor}
+
+
+@movie_router.get('/export/')
+async def movie_export(format: str = Query('ndjson', pattern='^(ndjson|csv)$'), genres: bool = False,
+                       actors: bool = False, filters: MovieFilterParams = Depends()):
+    query = bulk_export.export_query(filters.clauses(), genres=genres, actors=actors)
+    return StreamingResponse(bulk_export.export_movies(query, format), media_type=bulk_export.MEDIA_TYPES[format],
+                             headers={'Content-Disposition': f'attachment; filename="movies.{format}"'})
+
+
+async def ranked_movies(db: AsyncSession, ranking):
+    # (movie_id, score) pairs from an index or leaderboard, joined to their summaries in one query
+    if not ranking:
+        return []
+    scores = dict(ranking)
+    rows = (await db.execute(select(Movie.id, Movie.movie_name, Movie.movie_image, Movie.year)
+                             .where(Movie.id.in_(scores)))).all()
+    return sorted(({**row._asdict(), 'score': scores[row.id]} for row in rows), key=lambda row: -row['score'])
+
+
+@movie_router.get('/trending/', response_model=List[RankedMovieSchema])
+async def movie_trending(window: str = Query('all', pattern='^(all|day|week)$'),
+                         limit: int = Query(settings.PAGE_SIZE, ge=1, le=settings.PAGE_SIZE_MAX),
+                         db: AsyncSession = Depends(get_db)):
+    ranking = await leaderboard.trending(window, limit)
+    if ranking is None:
+        raise HTTPException(status_code=503, detail='Leaderboard is unavailable')
+    return await ranked_movies(db, ranking)
+
+
+@movie_router.get('/top/', response_model=List[RankedMovieSchema])
+async def movie_top(limit: int = Query(settings.PAGE_SIZE, ge=1, le=settings.PAGE_SIZE_MAX),
+                    db: AsyncSession = Depends(get_db)):
+    ranking = await leaderboard.top(db, limit)
+    if ranking is None:
+        raise HTTPException(status_code=503, detail='Leaderboard is unavailable')
+    return await ranked_movies(db, ranking)
 
 
 @movie_router.get('/{movie_id}/', response_model=MovieSchema)
-async def movie_detail(movie_id: int, db: Session = Depends(get_db)):
-    movie_db = db.query(Movie).filter(Movie.id == movie_id).first()
-    if movie_db is None:
+async def movie_detail(request: Request, movie_id: int, db: AsyncSession = Depends(get_db)):
+    async def load():
+        movie_db = await db.get(Movie, movie_id)
+        if movie_db is None:
+            raise HTTPException(status_code=404, detail='Movie not found')
+        return movie_db
+
+    return await cache.read_through(request, cache.key('movie', movie_id), MovieSchema, load)
+
+
+@movie_router.get('/{movie_id}/card/', response_model=MovieCardSchema)
+async def movie_card(request: Request, movie_id: int, db: AsyncSession = Depends(get_db)):
+    async def load():
+        movie_db = await load_card(db, movie_id)
+        if movie_db is None:
+            raise HTTPException(status_code=404, detail='Movie not found')
+        return movie_db
+
+    return await cache.read_through(request, cache.key('movie', movie_id, 'card'), MovieCardSchema, load)
+
+
+@movie_router.get('/{movie_id}/similar/', response_model=List[RankedMovieSchema])
+async def movie_similar(movie_id: int, limit: int = Query(10, ge=1, le=settings.SIMILAR_TOP_K),
+                        db: AsyncSession = Depends(get_db)):
+    if not await similar.ensure_index():
+        raise HTTPException(status_code=503, detail='Similar movies are unavailable')
+    neighbours = await similar.neighbours(db, movie_id, limit)
+    if neighbours is None:
         raise HTTPException(status_code=404, detail='Movie not found')
-    return movie_db
+    return await ranked_movies(db, neighbours)
 
 
 @movie_router.put('/{movie_id}/', response_model=MovieSchema)
-async def movie_update(movie_id: int, movie: MovieSchema, db: Session = Depends(get_db)):
-    movie_db = db.query(Movie).filter(Movie.id == movie_id).first()
+async def movie_update(movie_id: int, movie: MovieSchema, db: AsyncSession = Depends(get_db)):
+    movie_db = await db.get(Movie, movie_id)
     if movie_db is None:
         raise HTTPException(status_code=404, detail='Movie not found')
 
@@ -48,35 +178,23 @@ async def movie_update(movie_id: int, movie: MovieSchema, db: Session = Depends(
         setattr(movie_db, movie_key, movie_value)
 
     db.add(movie_db)
-    db.commit()
-    db.refresh(movie_db)
+    await db.commit()
+    await db.refresh(movie_db)
+    await cache.invalidate(cache.key('movie', movie_id), *cache.card_keys([movie_id]), cache.list_key('movie'))
+    await similar.refresh_movies(db, [movie_id])
     return movie_db
 
 
 @movie_router.delete('/{movie_id}/')
-async def movie_delete(movie_id: int, db: Session = Depends(get_db)):
-    movie_db = db.query(Movie).filter(Movie.id == movie_id).first()
+async def movie_delete(movie_id: int, db: AsyncSession = Depends(get_db)):
+    movie_db = await db.get(Movie, movie_id)
     if movie_db is None:
         raise HTTPException(status_code=404, detail='Movie not found')
 
-    db.delete(movie_db)
-    db.commit()
+    await db.delete(movie_db)
+    await db.commit()
+    await cache.invalidate(cache.key('movie', movie_id), *cache.card_keys([movie_id]), cache.list_key('movie'))
+    await similar.refresh_movies(db, [movie_id])
+    await leaderboard.forget([movie_id])
     return {'message': 'Movie is deleted'}
 
-
-# unique together logic for user and movie in rating
-
-# @app.post("/reviews/")
-# async def create_review(review: ReviewSchema, db: Session = Depends(get_db)):
-#     # Check if the user has already rated the movie
-#     existing_review = db.query(Review).filter(Review.user_id == review.user_id, Review.movie_id == review.movie_id).first()
-#
-#     if existing_review:
-#         raise HTTPException(status_code=400, detail="You have already rated this movie.")
-#
-#     # If no review exists, create a new one
-#     new_review = Review(**review.dict())
-#     db.add(new_review)
-#     db.commit()
-#     db.refresh(new_review)
-#     return new_review
@@ -0,0 +1,34 @@
+from movie_app.db.models import Actor, MovieActor
+from movie_app.db.schema import MovieLinkSchema, MovieLinkResultSchema
+from movie_app.db.database import get_db
+from movie_app.db.links import MovieLinks
+from movie_app import cache, similar
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends
+
+movie_actor_router = APIRouter(prefix='/movie-actor', tags=['Movie Actors'])
+
+movie_actors = MovieLinks(MovieActor, Actor)
+
+
+async def _commit(db: AsyncSession, movie_ids, counts):
+    await db.commit()
+    if any(counts):
+        await cache.invalidate(*cache.card_keys(movie_ids))
+        await similar.refresh_movies(db, movie_ids)
+    return {'added': counts[0], 'removed': counts[1]}
+
+
+@movie_actor_router.put('/', response_model=MovieLinkResultSchema)
+async def movie_actor_set(links: MovieLinkSchema, db: AsyncSession = Depends(get_db)):
+    return await _commit(db, links.movie_ids, await movie_actors.replace(db, links.movie_ids, links.ids))
+
+
+@movie_actor_router.post('/', response_model=MovieLinkResultSchema)
+async def movie_actor_add(links: MovieLinkSchema, db: AsyncSession = Depends(get_db)):
+    return await _commit(db, links.movie_ids, await movie_actors.add(db, links.movie_ids, links.ids))
+
+
+@movie_actor_router.post('/remove/', response_model=MovieLinkResultSchema)
+async def movie_actor_remove(links: MovieLinkSchema, db: AsyncSession = Depends(get_db)):
+    return await _commit(db, links.movie_ids, await movie_actors.remove(db, links.movie_ids, links.ids))
@@ -0,0 +1,35 @@
+from movie_app.db.models import Genre, MovieGenre
+from movie_app.db.schema import MovieLinkSchema, MovieLinkResultSchema
+from movie_app.db.database import get_db
+from movie_app.db.links import MovieLinks
+from movie_app import cache, similar
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends
+
+movie_genre_router = APIRouter(prefix='/movie-genre', tags=['Movie Genres'])
+
+movie_genres = MovieLinks(MovieGenre, Genre)
+
+
+async def _commit(db: AsyncSession, movie_ids, counts):
+    await db.commit()
+    if any(counts):
+        # genre filters and facet counts on the movie list change along with the cards
+        await cache.invalidate(*cache.card_keys(movie_ids), cache.list_key('movie'))
+        await similar.refresh_movies(db, movie_ids)
+    return {'added': counts[0], 'removed': counts[1]}
+
+
+@movie_genre_router.put('/', response_model=MovieLinkResultSchema)
+async def movie_genre_set(links: MovieLinkSchema, db: AsyncSession = Depends(get_db)):
+    return await _commit(db, links.movie_ids, await movie_genres.replace(db, links.movie_ids, links.ids))
+
+
+@movie_genre_router.post('/', response_model=MovieLinkResultSchema)
+async def movie_genre_add(links: MovieLinkSchema, db: AsyncSession = Depends(get_db)):
+    return await _commit(db, links.movie_ids, await movie_genres.add(db, links.movie_ids, links.ids))
+
+
+@movie_genre_router.post('/remove/', response_model=MovieLinkResultSchema)
+async def movie_genre_remove(links: MovieLinkSchema, db: AsyncSession = Depends(get_db)):
+    return await _commit(db, links.movie_ids, await movie_genres.remove(db, links.movie_ids, links.ids))
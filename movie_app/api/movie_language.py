@@ -1,45 +1,42 @@
 from movie_app.db.models import MovieLanguage, Movie
-from movie_app.db.schema import MovieLanguageSchema
-from movie_app.db.database import SessionLocal
-from sqlalchemy.orm import Session
-from typing import List
+from movie_app.db.schema import MovieLanguageSchema, Page
+from movie_app.db.database import get_db
+from movie_app.db.pagination import PageParams, paginate_rows
+from movie_app import reference
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, HTTPException
 
 movie_lang_router = APIRouter(prefix='/movie_lang', tags=['Movie Languages'])
 
+MOVIE_LANG_SORT_FIELDS = {'id': MovieLanguage.id, 'language': MovieLanguage.language}
 
-async def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @movie_lang_router.post('/', response_model=MovieLanguageSchema)
-async def movie_lang_create(movie_lang: MovieLanguageSchema, db: Session = Depends(get_db)):
+async def movie_lang_create(movie_lang: MovieLanguageSchema, db: AsyncSession = Depends(get_db)):
     movie_lang_db = MovieLanguage(**movie_lang.dict())
     db.add(movie_lang_db)
-    db.commit()
-    db.refresh(movie_lang_db)
+    await db.commit()
+    await db.refresh(movie_lang_db)
+    await reference.movie_languages.invalidate()
     return movie_lang_db
 
 
-@movie_lang_router.get('/', response_model=List[MovieLanguageSchema])
-async def movie_lang_list(db: Session = Depends(get_db)):
-    return db.query(MovieLanguage).all()
+@movie_lang_router.get('/', response_model=Page[MovieLanguageSchema])
+async def movie_lang_list(page: PageParams = Depends()):
+    return paginate_rows(await reference.movie_languages.all(), page, MOVIE_LANG_SORT_FIELDS)
 
 
 @movie_lang_router.get('/{movie_lang_id}/', response_model=MovieLanguageSchema)
-async def movie_lang_detail(movie_lang_id: int, db: Session = Depends(get_db)):
-    movie_lang_db = db.query(MovieLanguage).filter(MovieLanguage.id == movie_lang_id).first()
+async def movie_lang_detail(movie_lang_id: int):
+    movie_lang_db = await reference.movie_languages.get(movie_lang_id)
     if movie_lang_db is None:
         raise HTTPException(status_code=404, detail='Movie language not found')
     return movie_lang_db
 
 
 @movie_lang_router.put('/{movie_lant_id}/', response_model=MovieLanguageSchema)
-async def movie_lang_update(movie_lang_id: int, movie_lang: MovieLanguageSchema, db: Session = Depends(get_db)):
-    movie_lang_db = db.query(MovieLanguage).filter(MovieLanguage.id == movie_lang_id).first()
+async def movie_lang_update(movie_lang_id: int, movie_lang: MovieLanguageSchema, db: AsyncSession = Depends(get_db)):
+    movie_lang_db = await db.get(MovieLanguage, movie_lang_id)
     if movie_lang_db is None:
         raise HTTPException(status_code=404, detail='Movie language not found')
 
@@ -47,17 +44,19 @@ async def movie_lang_update(movie_lang_id: int, movie_lang: MovieLanguageSchema,
         setattr(movie_lang_db, movie_lang_key, movie_lang_value)
 
     db.add(movie_lang_db)
-    db.commit()
-    db.refresh(movie_lang_db)
+    await db.commit()
+    await db.refresh(movie_lang_db)
+    await reference.movie_languages.invalidate()
     return movie_lang_db
 
 
 @movie_lang_router.delete('/{movie_lant_id}/')
-async def movie_lang_delete(movie_lant_id: int, db: Session = Depends(get_db)):
-    movie_lant_db = db.query(MovieLanguage).filter(MovieLanguage.id == movie_lant_id).first()
+async def movie_lang_delete(movie_lant_id: int, db: AsyncSession = Depends(get_db)):
+    movie_lant_db = await db.get(MovieLanguage, movie_lant_id)
     if movie_lant_db is None:
         raise HTTPException(status_code=404, detail='Movie language not found')
 
-    db.delete(movie_lant_db)
-    db.commit()
+    await db.delete(movie_lant_db)
+    await db.commit()
+    await reference.movie_languages.invalidate()
     return {'message': 'Movie language is deleted'}
@@ -1 +1,218 @@
-# from start here
\ No newline at end of file
+from movie_app.db.models import Review, MovieRating
+from movie_app.db.schema import (ReviewCreateSchema, ReviewUpdateSchema, ReviewDetailSchema, ReviewTreeSchema,
+                                 CurrentUserSchema, Page)
+from movie_app.db.database import get_db
+from movie_app.db.pagination import PageParams, paginate, encode_cursor, decode_cursor
+from movie_app.api.auth import get_current_user
+from movie_app.config import settings
+from movie_app import cache, leaderboard
+from movie_app.fastjson import RowSerializer
+from sqlalchemy import select, func, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+review_router = APIRouter(prefix='/review', tags=['Reviews'])
+
+REVIEW_SORT_FIELDS = {'id': Review.id}
+REVIEW_ROWS = RowSerializer(ReviewDetailSchema, Review)
+RATING_UNIQUE = 'uq_review_user_id_movie_id_rating'
+RATING_COLUMNS = ['rating_count', 'rating_sum', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5']
+
+
+def _rating(review) -> Optional[int]:
+    # only a top-level review counts as a rating
+    return review.stars if review.parent_id is None else None
+
+
+async def apply_rating(db: AsyncSession, movie_id: int, old_stars: Optional[int], new_stars: Optional[int]):
+    # the totals move by a delta in the same transaction as the review, so reads never aggregate;
+    # returns whether they moved, so the caller knows to update the leaderboard after its commit
+    if old_stars == new_stars:
+        return False
+    delta = dict.fromkeys(RATING_COLUMNS, 0)
+    if old_stars is not None:
+        delta['rating_count'] -= 1
+        delta['rating_sum'] -= old_stars
+        delta[f'stars_{old_stars}'] -= 1
+    if new_stars is not None:
+        delta['rating_count'] += 1
+        delta['rating_sum'] += new_stars
+        delta[f'stars_{new_stars}'] += 1
+
+    query = insert(MovieRating).values(movie_id=movie_id, **delta)
+    await db.execute(query.on_conflict_do_update(
+        index_elements=['movie_id'],
+        set_={column: getattr(MovieRating, column) + query.excluded[column] for column in RATING_COLUMNS}))
+    return True
+
+
+def _integrity_error(error: IntegrityError):
+    if RATING_UNIQUE in str(error.orig):
+        return HTTPException(status_code=400, detail='You have already rated this movie.')
+    return HTTPException(status_code=404, detail='Movie not found')
+
+
+@review_router.post('/', response_model=ReviewDetailSchema)
+async def review_create(review: ReviewCreateSchema, current_user: CurrentUserSchema = Depends(get_current_user),
+                        db: AsyncSession = Depends(get_db)):
+    if review.parent_id is not None:
+        if review.stars is not None:
+            raise HTTPException(status_code=400, detail='A reply cannot rate the movie')
+        parent_db = await db.get(Review, review.parent_id)
+        if parent_db is None or parent_db.movie_id != review.movie_id:
+            raise HTTPException(status_code=404, detail='Parent review not found')
+
+    review_db = Review(**review.dict(), user_id=current_user.id)
+    db.add(review_db)
+    try:
+        await db.flush()
+    except IntegrityError as e:
+        await db.rollback()
+        raise _integrity_error(e)
+    rated = await apply_rating(db, review_db.movie_id, None, _rating(review_db))
+    await db.commit()
+    await cache.invalidate(*cache.card_keys([review_db.movie_id]))
+    await leaderboard.record([review_db.movie_id], leaderboard.REVIEW_WEIGHT)
+    if rated:
+        await leaderboard.update_top(db, review_db.movie_id)
+    return review_db
+
+
+@review_router.get('/', response_model=Page[ReviewDetailSchema])
+async def review_list(movie_id: Optional[int] = None, page: PageParams = Depends(),
+                      db: AsyncSession = Depends(get_db)):
+    query = REVIEW_ROWS.select()
+    if movie_id is not None:
+        query = query.where(Review.movie_id == movie_id)
+    return REVIEW_ROWS.response(await paginate(db, query, page, REVIEW_SORT_FIELDS, scalars=False))
+
+
+def subtree_count(review_id: int):
+    # the review and every reply below it, i.e. the rows ON DELETE CASCADE removes with it
+    tree = select(Review.id.label('id')).where(Review.id == review_id).cte('review_subtree', recursive=True)
+    child = aliased(Review)
+    tree = tree.union_all(select(child.id).join(tree, child.parent_id == tree.c.id))
+    return select(func.count()).select_from(tree)
+
+
+def thread_query(movie_id: int, after: Optional[int], limit: int, max_depth: int, max_replies: int):
+    # a page of top-level reviews, then every descendant down to max_depth in one recursive CTE
+    roots = select(Review.id).where(Review.movie_id == movie_id, Review.parent_id.is_(None))
+    if after is not None:
+        roots = roots.where(Review.id > after)
+    roots = roots.order_by(Review.id).limit(limit + 1)
+
+    tree = (select(Review.id.label('id'), Review.id.label('root_id'), literal(0).label('depth'))
+            .where(Review.id.in_(roots.scalar_subquery()))
+            .cte('review_tree', recursive=True))
+    child = aliased(Review)
+    tree = tree.union_all(
+        select(child.id, tree.c.root_id, tree.c.depth + 1)
+        .join(tree, child.parent_id == tree.c.id)
+        .where(tree.c.depth < max_depth))
+
+    # breadth first inside a thread, so a reply is never kept without its parent
+    position = func.row_number().over(partition_by=tree.c.root_id, order_by=(tree.c.depth, tree.c.id))
+    total = func.count().over(partition_by=tree.c.root_id)
+    ranked = (select(Review.id, Review.stars, Review.text, Review.parent_id, Review.user_id, tree.c.root_id,
+                     tree.c.depth, position.label('position'), (total - 1).label('total_replies'))
+              .join(tree, tree.c.id == Review.id)
+              .subquery())
+    return (select(ranked).where(ranked.c.position <= max_replies + 1)
+            .order_by(ranked.c.root_id, ranked.c.position))
+
+
+def build_threads(rows):
+    threads, nodes = [], {}
+    for row in rows:
+        node = {'id': row.id, 'stars': row.stars, 'text': row.text, 'parent_id': row.parent_id,
+                'user_id': row.user_id, 'depth': row.depth, 'replies': []}
+        nodes[row.id] = node
+        if row.depth == 0:
+            node['total_replies'] = row.total_replies
+            threads.append(node)
+        else:
+            nodes[row.parent_id]['replies'].append(node)
+    return threads
+
+
+@review_router.get('/threads/', response_model=Page[ReviewTreeSchema])
+async def review_threads(movie_id: int, cursor: Optional[str] = None,
+                         limit: int = Query(settings.PAGE_SIZE, ge=1, le=settings.PAGE_SIZE_MAX),
+                         max_depth: int = Query(settings.REVIEW_THREAD_DEPTH, ge=0, le=settings.REVIEW_THREAD_DEPTH),
+                         max_replies: int = Query(settings.REVIEW_THREAD_REPLIES, ge=0,
+                                                  le=settings.REVIEW_THREAD_REPLIES),
+                         db: AsyncSession = Depends(get_db)):
+    after = decode_cursor(cursor, [Review.id])[0] if cursor else None
+    rows = (await db.execute(thread_query(movie_id, after, limit, max_depth, max_replies))).all()
+    threads = build_threads(rows)
+
+    next_cursor = None
+    if len(threads) > limit:
+        threads = threads[:limit]
+        next_cursor = encode_cursor([threads[-1]['id']])
+    return {'items': threads, 'next_cursor': next_cursor}
+
+
+@review_router.get('/{review_id}/', response_model=ReviewDetailSchema)
+async def review_detail(review_id: int, db: AsyncSession = Depends(get_db)):
+    review_db = await db.get(Review, review_id)
+    if review_db is None:
+        raise HTTPException(status_code=404, detail='Review not found')
+    return review_db
+
+
+@review_router.put('/{review_id}/', response_model=ReviewDetailSchema)
+async def review_update(review_id: int, review: ReviewUpdateSchema,
+                        current_user: CurrentUserSchema = Depends(get_current_user),
+                        db: AsyncSession = Depends(get_db)):
+    # the row lock keeps two edits of one review from applying the same old rating twice
+    review_db = await db.get(Review, review_id, with_for_update=True)
+    if review_db is None:
+        raise HTTPException(status_code=404, detail='Review not found')
+    if review_db.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail='You can only edit your own review')
+    if review_db.parent_id is not None and review.stars is not None:
+        raise HTTPException(status_code=400, detail='A reply cannot rate the movie')
+
+    old_stars = _rating(review_db)
+    for review_key, review_value in review.dict().items():
+        setattr(review_db, review_key, review_value)
+
+    try:
+        await db.flush()
+    except IntegrityError as e:
+        await db.rollback()
+        raise _integrity_error(e)
+    rated = await apply_rating(db, review_db.movie_id, old_stars, _rating(review_db))
+    await db.commit()
+    await cache.invalidate(*cache.card_keys([review_db.movie_id]))
+    if rated:
+        await leaderboard.update_top(db, review_db.movie_id)
+    return review_db
+
+
+@review_router.delete('/{review_id}/')
+async def review_delete(review_id: int, current_user: CurrentUserSchema = Depends(get_current_user),
+                        db: AsyncSession = Depends(get_db)):
+    review_db = await db.get(Review, review_id, with_for_update=True)
+    if review_db is None:
+        raise HTTPException(status_code=404, detail='Review not found')
+    if review_db.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail='You can only delete your own review')
+
+    # replies go with it through ON DELETE CASCADE, they carry no rating of their own but each one
+    # was recorded in trending
+    deleted = await db.scalar(subtree_count(review_id))
+    await db.delete(review_db)
+    rated = await apply_rating(db, review_db.movie_id, _rating(review_db), None)
+    await db.commit()
+    await cache.invalidate(*cache.card_keys([review_db.movie_id]))
+    await leaderboard.record([review_db.movie_id], -leaderboard.REVIEW_WEIGHT * deleted)
+    if rated:
+        await leaderboard.update_top(db, review_db.movie_id)
+    return {'message': 'Review is deleted'}
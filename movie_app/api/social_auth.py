@@ -1,5 +1,3 @@
-from sqlalchemy.orm import Session
-from movie_app.db.database import SessionLocal
 from fastapi import APIRouter, Depends
 from starlette.requests import Request
 from movie_app.config import settings
@@ -24,14 +22,6 @@ oauth.register(
 )
 
 
-async def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @social_router.get("/github/")
 async def github_login(request: Request):
     redirect_url = settings.GITHUB_LOGIN_CALLBACK
@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from movie_app.db.database import pool_stats
+
+stats_router = APIRouter(prefix='/stats', tags=['Stats'])
+
+
+@stats_router.get('/db/')
+async def db_pool_stats():
+    return pool_stats()
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+from datetime import date, time
+from enum import Enum
+from sqlalchemy import select
+from movie_app.bulk_import import CSV_LIST_SEPARATOR
+from movie_app.config import settings
+from movie_app.db.database import SessionLocal
+from movie_app.db.filters import genre_names, actor_names
+from movie_app.db.models import Movie
+
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# same column names the importer reads (it ignores id), so an export can be loaded back
+MOVIE_COLUMNS = [Movie.id, Movie.movie_name, Movie.movie_trailer, Movie.movie_image, Movie.status_movie, Movie.year,
+                 Movie.type, Movie.movie_time, Movie.description, Movie.country_id, Movie.director_id]
+
+
+def export_query(clauses=(), genres: bool = False, actors: bool = False):
+    columns = list(MOVIE_COLUMNS)
+    if genres:
+        columns.append(genre_names().label('genre'))
+    if actors:
+        columns.append(actor_names().label('actor'))
+    return select(*columns).where(*clauses).order_by(Movie.id)
+
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _ndjson(rows):
+    return ''.join(json.dumps({key: _plain(value) for key, value in row._mapping.items()}, ensure_ascii=False) + '\n'
+                   for row in rows)
+
+
+def _csv(rows, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    for row in rows:
+        writer.writerow([CSV_LIST_SEPARATOR.join(value) if isinstance(value, list) else value
+                         for value in map(_plain, row)])
+    return buffer.getvalue()
+
+
+async def export_movies(query, fmt: str):
+    # own session: a dependency session is already closed by the time the body streams;
+    # stream() keeps a server-side cursor open and fetches EXPORT_BATCH_SIZE rows per round trip
+    async with SessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        header = list(result.keys()) if fmt == 'csv' else None
+        if header:
+            yield _csv([], header)
+        async for rows in result.partitions():
+            yield _ndjson(rows) if fmt == 'ndjson' else _csv(rows)
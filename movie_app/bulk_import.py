@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import csv
+import sys
+import asyncpg
+from typing import AsyncIterator, Dict, List, Tuple, Union
+from pydantic import ValidationError
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from movie_app import cache, reference
+from movie_app.config import settings
+from movie_app.db.database import SessionLocal, engine
+from movie_app.db.models import Actor, Country, Director, Genre, Movie
+from movie_app.db.schema import MovieImportSchema
+
+FORMATS = ('ndjson', 'csv')
+
+# search_vector is generated by postgres, id is taken from the sequence up front
+MOVIE_COLUMNS = ['id', 'movie_name', 'movie_trailer', 'movie_image', 'status_movie', 'year', 'type', 'movie_time',
+                 'description', 'country_id', 'director_id']
+
+# csv has no arrays, these columns hold '|' separated values
+CSV_LIST_SEPARATOR = '|'
+CSV_LIST_FIELDS = ('type', 'genre', 'actor')
+
+
+def _decode(line: bytes):
+    # a line that is not utf-8 becomes that line's error instead of failing the whole upload
+    try:
+        return line.decode('utf-8').rstrip('\r')
+    except UnicodeDecodeError as e:
+        return e
+
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Union[str, UnicodeDecodeError]]:
+    tail = b''
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            yield _decode(line)
+    if tail:
+        yield _decode(tail)
+
+
+async def ndjson_records(lines: AsyncIterator[str]):
+    number = 0
+    async for line in lines:
+        number += 1
+        if isinstance(line, Exception) or line.strip():
+            yield number, line
+
+
+async def csv_records(lines: AsyncIterator[str]):
+    header, pending, start, number = None, [], 0, 0
+    async for line in lines:
+        number += 1
+        if isinstance(line, Exception):
+            # the record it belongs to is lost, report it where that record started
+            yield (start if pending else number), line
+            pending = []
+            continue
+        if not pending:
+            if not line.strip():
+                continue
+            start = number
+        pending.append(line)
+        # a quoted field may span lines, the record is complete once its quotes balance
+        if sum(part.count('"') for part in pending) % 2:
+            continue
+        row = next(csv.reader([part + '\n' for part in pending]))
+        pending = []
+        if header is None:
+            header = [name.strip() for name in row]
+            continue
+        data = {name: value for name, value in zip(header, row) if value != ''}
+        for name in CSV_LIST_FIELDS:
+            if name in data:
+                data[name] = [value.strip() for value in data[name].split(CSV_LIST_SEPARATOR) if value.strip()]
+        yield start, data
+    if pending:
+        yield start, ValueError('Unterminated quoted field')
+
+
+def validate(data) -> MovieImportSchema:
+    if isinstance(data, Exception):
+        raise data
+    if isinstance(data, str):
+        return MovieImportSchema.model_validate_json(data)
+    return MovieImportSchema.model_validate(data)
+
+
+def error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return '; '.join(f'{".".join(str(part) for part in detail["loc"]) or "row"}: {detail["msg"]}'
+                         for detail in error.errors())
+    return str(error).strip().splitlines()[0] if str(error).strip() else type(error).__name__
+
+
+def _name(ref, name_field):
+    return ref if isinstance(ref, str) else getattr(ref, name_field)
+
+
+async def _existing(db, model, name_column, names) -> Dict[str, int]:
+    if not names:
+        return {}
+    rows = await db.execute(select(name_column, func.min(model.id)).where(name_column.in_(names))
+                            .group_by(name_column))
+    return dict(rows.all())
+
+
+async def resolve_countries(db, names) -> Dict[str, int]:
+    if not names:
+        return {}
+    await db.execute(insert(Country).values([{'country_name': name} for name in names])
+                     .on_conflict_do_nothing(index_elements=['country_name']))
+    return await _existing(db, Country, Country.country_name, names)
+
+
+async def resolve_genres(db, names) -> Dict[str, int]:
+    found = await _existing(db, Genre, Genre.genre_name, names)
+    missing = [{'genre_name': name} for name in names if name not in found]
+    if missing:
+        rows = await db.execute(insert(Genre).values(missing).returning(Genre.genre_name, Genre.id))
+        found.update(rows.all())
+    return found
+
+
+async def resolve_people(db, model, name_column, refs) -> Dict[str, int]:
+    # names are looked up, full objects are created when their name is unknown
+    name_field = name_column.key
+    found = await _existing(db, model, name_column, {_name(ref, name_field) for ref in refs})
+    missing = {}
+    for ref in refs:
+        if not isinstance(ref, str) and getattr(ref, name_field) not in found:
+            missing.setdefault(getattr(ref, name_field), ref.model_dump())
+    if missing:
+        rows = await db.execute(insert(model).values(list(missing.values())).returning(name_column, model.id))
+        found.update(rows.all())
+    return found
+
+
+async def write_batch(db, batch: List[Tuple[int, MovieImportSchema]]):
+    errors = []
+    countries = await resolve_countries(db, {movie.country_name for _, movie in batch if movie.country_id is None})
+    genres = await resolve_genres(db, {name for _, movie in batch for name in movie.genre})
+    actors = await resolve_people(db, Actor, Actor.actor_name, [ref for _, movie in batch for ref in movie.actor])
+    directors = await resolve_people(db, Director, Director.director_name,
+                                     [movie.director for _, movie in batch if movie.director is not None])
+
+    resolved = []
+    for line, movie in batch:
+        director_id = movie.director_id
+        if movie.director is not None:
+            director_id = directors.get(_name(movie.director, 'director_name'))
+        missing = [_name(ref, 'actor_name') for ref in movie.actor if _name(ref, 'actor_name') not in actors]
+        if movie.director is not None and director_id is None:
+            errors.append({'line': line, 'error': f'Unknown director {_name(movie.director, "director_name")}'})
+        elif missing:
+            errors.append({'line': line, 'error': f'Unknown actor {", ".join(missing)}'})
+        else:
+            resolved.append((line, movie, movie.country_id or countries[movie.country_name], director_id))
+
+    # a director has at most one movie, reject the row instead of failing the whole COPY
+    director_ids = {director_id for *_, director_id in resolved if director_id is not None}
+    taken = set()
+    if director_ids:
+        taken = set((await db.scalars(select(Movie.director_id).where(Movie.director_id.in_(director_ids)))).all())
+    rows = []
+    for line, movie, country_id, director_id in resolved:
+        if director_id is not None and director_id in taken:
+            errors.append({'line': line, 'error': f'Director {director_id} already has a movie'})
+            continue
+        taken.add(director_id)
+        rows.append((movie, country_id, director_id))
+    if not rows:
+        return 0, errors
+
+    ids = (await db.scalars(select(func.nextval(func.pg_get_serial_sequence('movie', 'id')))
+                            .select_from(func.generate_series(1, len(rows))))).all()
+    movie_records, genre_records, actor_records = [], set(), set()
+    for movie_id, (movie, country_id, director_id) in zip(ids, rows):
+        movie_records.append((movie_id, movie.movie_name, movie.movie_trailer, movie.movie_image,
+                              movie.status_movie.value, movie.year, [choice.value for choice in movie.type],
+                              movie.movie_time, movie.description, country_id, director_id))
+        genre_records.update((movie_id, genres[name]) for name in movie.genre)
+        actor_records.update((movie_id, actors[_name(ref, 'actor_name')]) for ref in movie.actor)
+
+    # COPY goes through the session's own connection, so it commits or rolls back with the batch
+    connection = await db.connection()
+    driver = (await connection.get_raw_connection()).driver_connection
+    await driver.copy_records_to_table('movie', records=movie_records, columns=MOVIE_COLUMNS)
+    if genre_records:
+        await driver.copy_records_to_table('movie_genre', records=list(genre_records),
+                                           columns=['movie_id', 'genre_id'])
+    if actor_records:
+        await driver.copy_records_to_table('movie_actor', records=list(actor_records),
+                                           columns=['movie_id', 'actor_id'])
+    return len(movie_records), errors
+
+
+def _report(result, errors, failed: int = None):
+    # a failed batch is one error entry for all of its rows; the line range there is only for the reader
+    result['failed'] += len(errors) if failed is None else failed
+    room = settings.IMPORT_MAX_ERRORS - len(result['errors'])
+    result['errors'].extend(errors[:max(room, 0)])
+
+
+async def flush(batch, result):
+    async with SessionLocal() as db:
+        try:
+            imported, errors = await write_batch(db, batch)
+            await db.commit()
+            failed = len(errors)
+        except (SQLAlchemyError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            await db.rollback()
+            imported, errors = 0, [{'line': batch[0][0], 'last_line': batch[-1][0], 'error': error_message(e)}]
+            failed = len(batch)
+    result['imported'] += imported
+    _report(result, errors, failed)
+
+
+async def import_movies(records, batch_size: int = None):
+    # holds one batch at a time, each batch is its own transaction so a bad one only loses itself
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    result = {'imported': 0, 'failed': 0, 'errors': []}
+    batch = []
+    async for line, data in records:
+        try:
+            batch.append((line, validate(data)))
+        except (ValidationError, ValueError) as e:
+            _report(result, [{'line': line, 'error': error_message(e)}])
+            continue
+        if len(batch) >= batch_size:
+            await flush(batch, result)
+            batch = []
+    if batch:
+        await flush(batch, result)
+
+    if result['imported']:
+        # new actors and directors may have been created along the way
+        await cache.invalidate(cache.list_key('movie'), cache.list_key('actor'), cache.list_key('director'))
+        await reference.countries.invalidate()
+        await reference.genres.invalidate()
+    return result
+
+
+def parse_records(chunks: AsyncIterator[bytes], fmt: str):
+    lines = read_lines(chunks)
+    return csv_records(lines) if fmt == 'csv' else ndjson_records(lines)
+
+
+async def _file_chunks(path, size=1 << 16):
+    # one chunk in memory at a time, the disk read is short enough to stay on the loop
+    with (sys.stdin.buffer if path == '-' else open(path, 'rb')) as file:
+        while chunk := file.read(size):
+            yield chunk
+
+
+async def run(path, fmt, batch_size):
+    await cache.init_redis()
+    try:
+        return await import_movies(parse_records(_file_chunks(path), fmt), batch_size)
+    finally:
+        await cache.redis.close()
+        await engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import movies from an NDJSON or CSV file.')
+    parser.add_argument('path', help="file to import, '-' reads stdin")
+    parser.add_argument('--format', choices=FORMATS, help='defaults to the file extension, then ndjson')
+    parser.add_argument('--batch-size', type=int, default=settings.IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+    result = asyncio.run(run(args.path, fmt, args.batch_size))
+    for error in result['errors']:
+        where = f'{error["line"]}-{error["last_line"]}' if 'last_line' in error else error['line']
+        print(f'line {where}: {error["error"]}')
+    print(f'imported {result["imported"]}, failed {result["failed"]}')
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
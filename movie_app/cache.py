@@ -0,0 +1,154 @@
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Awaitable, Callable, Optional, Union
+import redis.asyncio as aioredis
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from redis.client import NEVER_DECODE
+from redis.exceptions import RedisError
+from movie_app import compression
+from movie_app.config import settings
+
+redis: Optional[aioredis.Redis] = None
+
+
+async def init_redis():
+    global redis
+    redis = aioredis.from_url(settings.REDIS_URL, encoding='utf-8', decode_responses=True)
+    return redis
+
+
+def key(*parts):
+    return ':'.join(['cache', *map(str, parts)])
+
+
+def list_key(name: str):
+    return key(name, 'list')
+
+
+def card_keys(movie_ids):
+    return [key('movie', movie_id, 'card') for movie_id in movie_ids]
+
+
+@lru_cache(maxsize=None)
+def _adapter(schema):
+    return TypeAdapter(schema)
+
+
+def dump(schema, data) -> bytes:
+    adapter = _adapter(schema)
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+
+def make_etag(body: Union[str, bytes]) -> str:
+    if isinstance(body, str):
+        body = body.encode()
+    return f'"{blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in [tag.strip().removeprefix('W/') for tag in header.split(',')]
+
+
+def json_response(request: Request, body: Union[str, bytes], etag: Optional[str] = None,
+                  encoding: Optional[str] = None):
+    headers = {'ETag': etag or make_etag(body), 'Cache-Control': f'public, max-age={settings.HTTP_MAX_AGE}'}
+    if encoding:
+        headers.update({'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'})
+    if not_modified(request, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+def conditional_response(request: Request, etag: str, schema, data):
+    # the ETag is known up front, so a matching If-None-Match never reaches serialization;
+    # data may be a callable to skip building the payload as well
+    if not_modified(request, etag):
+        return json_response(request, b'', etag)
+    return json_response(request, dump(schema, data() if callable(data) else data), etag)
+
+
+def _field(field: Optional[str], encoding: Optional[str] = None) -> str:
+    # every entry is a hash: the body under its field and its compressed copies next to it.
+    # List pages share one hash, so a single DEL drops every page in every encoding
+    field = field or 'body'
+    return f'{field}|{encoding}' if encoding else field
+
+
+async def _read(cache_key: str, field: Optional[str], encoding: Optional[str]):
+    # one round trip for the plain body and the client's encoding; compressed bytes are not utf-8,
+    # so this read skips the client's response decoding
+    fields = [_field(field)] + ([_field(field, encoding)] if encoding else [])
+    values = await redis.execute_command('HMGET', cache_key, *fields, **{NEVER_DECODE: True})
+    return values[0], values[1] if encoding else None
+
+
+# a page or encoding added later does not extend the entry's life; EXPIRE NX would say the same
+# but needs Redis 7, and a failed EXPIRE after a successful HSET would leave the hash forever
+HSET_EXPIRE_ONCE = """
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+if redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+
+@lru_cache(maxsize=1)
+def _hset_expire_once(client):
+    return client.register_script(HSET_EXPIRE_ONCE)
+
+
+async def _write(cache_key: str, bodies: dict, ttl: int):
+    await _hset_expire_once(redis)(keys=[cache_key],
+                                   args=[ttl, *[part for item in bodies.items() for part in item]])
+
+
+def _compressible(body: Union[str, bytes], encoding: Optional[str]) -> bool:
+    return encoding is not None and len(body) >= settings.COMPRESS_MIN_SIZE
+
+
+async def read_through(request: Request, cache_key: str, schema, loader: Callable[[], Awaitable], field: Optional[str] = None,
+                       ttl: Optional[int] = None, dumper: Optional[Callable[[object], bytes]] = None):
+    # each body is compressed once per encoding and cached next to the plain one, which the
+    # compression middleware then passes through as is
+    encoding = compression.negotiate(request.headers.get('accept-encoding'))
+    body = compressed = None
+    if redis is not None:
+        try:
+            body, compressed = await _read(cache_key, field, encoding)
+        except RedisError:
+            pass
+        if compressed is not None:
+            return json_response(request, compressed, encoding=encoding)
+
+    missing = {}
+    if body is None:
+        data = await loader()
+        body = dumper(data) if dumper else dump(schema, data)
+        missing[_field(field)] = body
+    if _compressible(body, encoding):
+        compressed = compression.compress(encoding, body.encode() if isinstance(body, str) else body)
+        missing[_field(field, encoding)] = compressed
+    if redis is not None and missing:
+        try:
+            await _write(cache_key, missing, ttl or settings.CACHE_TTL)
+        except RedisError:
+            pass
+    if compressed is not None:
+        return json_response(request, compressed, encoding=encoding)
+    return json_response(request, body)
+
+
+async def invalidate(*keys: str):
+    if redis is None or not keys:
+        return
+    try:
+        await redis.delete(*keys)
+    except RedisError:
+        pass
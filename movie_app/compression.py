@@ -0,0 +1,189 @@
+import gzip
+import zlib
+from typing import Dict, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from movie_app.config import settings
+
+try:
+    import brotli
+except ImportError:  # br is only offered when the package is installed
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# already compressed payloads only get bigger and burn CPU
+SKIP_MEDIA_PREFIXES = ('image/', 'video/', 'audio/', 'font/woff')
+SKIP_MEDIA_TYPES = {'application/zip', 'application/gzip', 'application/x-gzip', 'application/zstd',
+                    'application/x-bzip2', 'application/x-7z-compressed', 'application/x-rar-compressed',
+                    'application/x-xz', 'application/octet-stream', 'application/pdf'}
+
+
+class _GzipStream:
+    def __init__(self):
+        # wbits=31 writes the gzip header and trailer around the deflate stream
+        self.stream = zlib.compressobj(settings.COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.stream.compress(chunk) + self.stream.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.stream.flush()
+
+
+class _BrotliStream:
+    def __init__(self):
+        self.stream = brotli.Compressor(quality=settings.COMPRESS_BROTLI_QUALITY)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.stream.process(chunk) + self.stream.flush()
+
+    def finish(self) -> bytes:
+        return self.stream.finish()
+
+
+class _ZstdStream:
+    def __init__(self):
+        self.stream = zstandard.ZstdCompressor(level=settings.COMPRESS_ZSTD_LEVEL).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.stream.compress(chunk) + self.stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.stream.flush()
+
+
+def _gzip(body: bytes) -> bytes:
+    # mtime=0 keeps the output byte-identical for identical bodies, so cached variants keep their ETag
+    return gzip.compress(body, compresslevel=settings.COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def _brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=settings.COMPRESS_BROTLI_QUALITY)
+
+
+def _zstd(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=settings.COMPRESS_ZSTD_LEVEL).compress(body)
+
+
+# encoding -> (one-shot compress, streaming compressor), in server preference order
+CODECS = {'zstd': (_zstd, _ZstdStream), 'br': (_brotli, _BrotliStream), 'gzip': (_gzip, _GzipStream)}
+INSTALLED = {'zstd': zstandard is not None, 'br': brotli is not None, 'gzip': True}
+AVAILABLE = [encoding for encoding in settings.COMPRESS_ENCODINGS if INSTALLED.get(encoding)]
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    # highest q-value wins, ties go to the server's order; q=0 and unknown codings are ignored
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(','):
+        coding, *params = [piece.strip() for piece in part.split(';')]
+        weight = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    wildcard = weights.get('*', 0.0)
+    best, best_weight = None, 0.0
+    for encoding in AVAILABLE:
+        weight = weights.get(encoding, wildcard)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(encoding: str, body: bytes) -> bytes:
+    return CODECS[encoding][0](body)
+
+
+def compressible(headers: Headers) -> bool:
+    if 'content-encoding' in headers or 'content-range' in headers:
+        return False
+    media_type = headers.get('content-type', '').split(';')[0].strip().lower()
+    return not (media_type.startswith(SKIP_MEDIA_PREFIXES) or media_type in SKIP_MEDIA_TYPES)
+
+
+def _weak(etag: str) -> str:
+    # the compressed bytes differ from the identity ones, a strong validator would lie about that
+    return etag if etag.startswith('W/') else f'W/{etag}'
+
+
+# a complete body under minimum_size goes out as is; a streamed body is compressed chunk by chunk and
+# flushed after each one, so an export keeps arriving while it runs. Responses that already carry a
+# Content-Encoding, like the response cache's precompressed bodies, pass through untouched
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get('accept-encoding'))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        await _CompressedResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressedResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start: Optional[Message] = None
+        self.stream = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_wrapper)
+
+    def _headers(self, length: Optional[int]) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.start['headers'])
+        headers['Content-Encoding'] = self.encoding
+        headers.add_vary_header('Accept-Encoding')
+        if 'etag' in headers:
+            headers['ETag'] = _weak(headers['etag'])
+        if length is None:
+            del headers['Content-Length']
+        else:
+            headers['Content-Length'] = str(length)
+        return headers
+
+    async def send_wrapper(self, message: Message):
+        if message['type'] == 'http.response.start':
+            self.start = message
+            self.passthrough = not compressible(Headers(raw=message['headers']))
+            return
+        if message['type'] != 'http.response.body':
+            return await self.send(message)
+        if self.passthrough:
+            if self.start is not None:
+                await self.send(self.start)
+                self.start = None
+            return await self.send(message)
+
+        body, more_body = message.get('body', b''), message.get('more_body', False)
+        if self.stream is None:
+            if not more_body:
+                # the whole body is here: compress it in one go, or leave a small one alone
+                if body and len(body) >= self.minimum_size:
+                    body = compress(self.encoding, body)
+                    self._headers(len(body))
+                await self.send(self.start)
+                return await self.send({'type': 'http.response.body', 'body': body})
+            self.stream = CODECS[self.encoding][1]()
+            self._headers(None)
+            await self.send(self.start)
+
+        chunk = self.stream.compress(body) if body else b''
+        if not more_body:
+            chunk += self.stream.finish()
+        await self.send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
@@ -0,0 +1,89 @@
+from datetime import date, time
+from typing import List, Optional
+from fastapi import Query
+from sqlalchemy import select, func, literal, cast, String, union_all
+from sqlalchemy.dialects.postgresql import ARRAY
+from movie_app.db.models import Actor, Genre, Movie, MovieActor, MovieGenre, StatusChoices, TypeChoices
+
+
+def _minutes(value: int) -> time:
+    return time(value // 60, value % 60)
+
+
+class MovieFilterParams:
+    def __init__(self, genre_id: List[int] = Query([]), country_id: Optional[int] = None,
+                 year_from: Optional[int] = Query(None, ge=1, le=9999),
+                 year_to: Optional[int] = Query(None, ge=1, le=9999),
+                 status_movie: Optional[StatusChoices] = None,
+                 min_minutes: Optional[int] = Query(None, ge=0, le=1439),
+                 max_minutes: Optional[int] = Query(None, ge=0, le=1439),
+                 quality: List[TypeChoices] = Query([], alias='type')):
+        self.genre_id = sorted(set(genre_id))
+        self.country_id = country_id
+        self.year_from = year_from
+        self.year_to = year_to
+        self.status_movie = status_movie
+        self.min_minutes = min_minutes
+        self.max_minutes = max_minutes
+        self.quality = sorted(set(quality))
+
+    @property
+    def cache_field(self):
+        return ':'.join(str(value) for value in (
+            ','.join(map(str, self.genre_id)), self.country_id, self.year_from, self.year_to,
+            self.status_movie and self.status_movie.value, self.min_minutes, self.max_minutes,
+            ','.join(value.value for value in self.quality)))
+
+    # exclude leaves one facet's own filter out, so its counts show what picking another value would give
+    def clauses(self, exclude: Optional[str] = None):
+        clauses = []
+        if self.genre_id and exclude != 'genre':
+            clauses.append(Movie.id.in_(select(MovieGenre.movie_id).where(MovieGenre.genre_id.in_(self.genre_id))))
+        if self.country_id is not None and exclude != 'country':
+            clauses.append(Movie.country_id == self.country_id)
+        if self.year_from is not None:
+            clauses.append(Movie.year >= date(self.year_from, 1, 1))
+        if self.year_to is not None:
+            clauses.append(Movie.year <= date(self.year_to, 12, 31))
+        if self.status_movie is not None and exclude != 'status_movie':
+            clauses.append(Movie.status_movie == self.status_movie)
+        if self.min_minutes is not None:
+            clauses.append(Movie.movie_time >= _minutes(self.min_minutes))
+        if self.max_minutes is not None:
+            clauses.append(Movie.movie_time <= _minutes(self.max_minutes))
+        if self.quality and exclude != 'type':
+            clauses.append(Movie.type.overlap(self.quality))
+        return clauses
+
+
+def facet_count_query(filters: MovieFilterParams):
+    type_value = func.unnest(Movie.type).column_valued('type_value')
+    return union_all(
+        select(literal('genre').label('facet'), cast(MovieGenre.genre_id, String).label('value'),
+               func.count().label('total'))
+        .join(Movie, Movie.id == MovieGenre.movie_id)
+        .where(*filters.clauses('genre')).group_by(MovieGenre.genre_id),
+        select(literal('country'), cast(Movie.country_id, String), func.count())
+        .where(*filters.clauses('country')).group_by(Movie.country_id),
+        select(literal('status_movie'), cast(Movie.status_movie, String), func.count())
+        .where(*filters.clauses('status_movie')).group_by(Movie.status_movie),
+        select(literal('type'), cast(type_value, String), func.count())
+        .select_from(Movie).where(*filters.clauses('type')).group_by(type_value),
+    )
+
+
+def _linked_names(model, name_column, link, link_column):
+    # correlated array_agg keeps one row per movie, so listing names adds no query of its own
+    return (select(func.coalesce(func.array_agg(name_column), literal([], ARRAY(String))))
+            .join(link, link_column == model.id)
+            .where(link.movie_id == Movie.id)
+            .correlate(Movie)
+            .scalar_subquery())
+
+
+def genre_names():
+    return _linked_names(Genre, Genre.genre_name, MovieGenre, MovieGenre.genre_id)
+
+
+def actor_names():
+    return _linked_names(Actor, Actor.actor_name, MovieActor, MovieActor.actor_id)
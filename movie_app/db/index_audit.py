@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import sys
+from sqlalchemy import inspect, UniqueConstraint
+from movie_app.db.database import engine
+from movie_app.db.models import Base
+
+
+def required_indexes(metadata):
+    # every foreign key is a join or lookup path, and every declared index is a promise made by a query
+    required = []
+    for table in metadata.sorted_tables:
+        for fk in table.foreign_key_constraints:
+            required.append((table.name, tuple(column.name for column in fk.columns),
+                             f'foreign key to {fk.referred_table.name}'))
+        for index in table.indexes:
+            required.append((table.name, tuple(column.name for column in index.columns), f'index {index.name}'))
+    return required
+
+
+def metadata_indexes(metadata):
+    existing = {}
+    for table in metadata.sorted_tables:
+        covered = existing.setdefault(table.name, [])
+        covered.append(tuple(column.name for column in table.primary_key.columns))
+        covered.extend(tuple(column.name for column in index.columns) for index in table.indexes)
+        covered.extend(tuple(column.name for column in constraint.columns)
+                       for constraint in table.constraints if isinstance(constraint, UniqueConstraint))
+        covered.extend((column.name,) for column in table.columns if column.unique)
+    return existing
+
+
+def database_indexes(connection):
+    inspector = inspect(connection)
+    existing = {}
+    for table_name in inspector.get_table_names():
+        covered = existing.setdefault(table_name, [])
+        covered.append(tuple(inspector.get_pk_constraint(table_name)['constrained_columns']))
+        covered.extend(tuple(index['column_names']) for index in inspector.get_indexes(table_name))
+        covered.extend(tuple(constraint['column_names'])
+                       for constraint in inspector.get_unique_constraints(table_name))
+    return existing
+
+
+def is_covered(columns, indexes):
+    # an index serves a lookup when the looked-up columns are its leading columns
+    return any(index[:len(columns)] == columns for index in indexes)
+
+
+def find_missing(required, existing):
+    return [(table, columns, reason) for table, columns, reason in required
+            if not is_covered(columns, existing.get(table, []))]
+
+
+async def load_database_indexes():
+    try:
+        async with engine.connect() as connection:
+            return await connection.run_sync(database_indexes)
+    finally:
+        await engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report foreign keys and declared indexes without a usable index.')
+    parser.add_argument('--metadata-only', action='store_true',
+                        help='check the models against themselves instead of the live database')
+    args = parser.parse_args(argv)
+
+    if args.metadata_only:
+        existing = metadata_indexes(Base.metadata)
+    else:
+        existing = asyncio.run(load_database_indexes())
+
+    missing = find_missing(required_indexes(Base.metadata), existing)
+    for table, columns, reason in missing:
+        print(f'missing index: {table}({", ".join(columns)}) -- {reason}')
+    if not missing:
+        print('all foreign keys and declared indexes are covered')
+    return 1 if missing else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+from typing import List, Tuple
+from sqlalchemy import select, delete, func, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from movie_app.db.models import Movie
+
+
+# set-based writes for the movie_actor / movie_genre association tables: every call is one
+# statement however many movies and targets it touches, and ids that do not exist are skipped
+class MovieLinks:
+    def __init__(self, link, target):
+        self.link = link
+        self.target = target
+        self.target_column = next(column for column in link.__table__.columns
+                                  if column.foreign_keys and column.name != 'movie_id')
+
+    def _insert(self, movie_ids: List[int], target_ids: List[int]):
+        return (insert(self.link)
+                .from_select(['movie_id', self.target_column.name],
+                             select(Movie.id, self.target.id)
+                             .where(Movie.id.in_(movie_ids), self.target.id.in_(target_ids)))
+                .on_conflict_do_nothing()
+                .returning(self.link.movie_id))
+
+    def _delete(self, movie_ids: List[int], target_ids: List[int], keep: bool = False):
+        matches = self.target_column.notin_(target_ids) if keep else self.target_column.in_(target_ids)
+        return delete(self.link).where(self.link.movie_id.in_(movie_ids), matches).returning(self.link.movie_id)
+
+    @staticmethod
+    async def _counts(db: AsyncSession, added=None, removed=None) -> Tuple[int, int]:
+        counts = [select(func.count()).select_from(statement.cte(name)).scalar_subquery() if statement is not None
+                  else literal(0) for name, statement in (('added', added), ('removed', removed))]
+        row = (await db.execute(select(*counts))).one()
+        return row[0], row[1]
+
+    async def add(self, db: AsyncSession, movie_ids: List[int], target_ids: List[int]):
+        if not target_ids:
+            return 0, 0
+        return await self._counts(db, added=self._insert(movie_ids, target_ids))
+
+    async def remove(self, db: AsyncSession, movie_ids: List[int], target_ids: List[int]):
+        if not target_ids:
+            return 0, 0
+        return await self._counts(db, removed=self._delete(movie_ids, target_ids))
+
+    async def replace(self, db: AsyncSession, movie_ids: List[int], target_ids: List[int]):
+        # one statement with two data-modifying CTEs: drop what is not listed, insert what is missing,
+        # links that stay are never touched
+        added = self._insert(movie_ids, target_ids) if target_ids else None
+        return await self._counts(db, added=added, removed=self._delete(movie_ids, target_ids, keep=True))
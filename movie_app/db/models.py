@@ -1,10 +1,12 @@
 from datetime import datetime, time, date
 from .database import Base
-from sqlalchemy import String, Integer, DateTime, Text, ForeignKey, Enum, ARRAY, Time, Date
+from sqlalchemy import (String, Integer, DateTime, Text, ForeignKey, Enum, Time, Date, Computed, Index, UniqueConstraint,
+                        text as sql_text)
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 from sqlalchemy.orm import Mapped, relationship, mapped_column
 from typing import List, Optional
 from enum import Enum as PyEnum, unique
-from passlib.hash import bcrypt
+from movie_app.passwords import password_context
 
 
 class StatusChoices(str, PyEnum):
@@ -36,20 +38,22 @@ class UserProfile(Base):
     user_favorite: Mapped['Favorite'] = relationship('Favorite', back_populates='user',
                                                      cascade='all, delete-orphan', uselist=False)
 
+    # blocking, keep out of request handlers and use movie_app.passwords there
     def set_passwords(self, password: str):
-        self.hashed_password = bcrypt.hash(password)
+        self.hashed_password = password_context.hash(password)
 
     def check_password(self, password: str):
-        return bcrypt.verify(password, self.hashed_password)
+        return password_context.verify(password, self.hashed_password)
 
 
 class RefreshToken(Base):
     __tablename__ = 'refresh_token'
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    token: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    jti: Mapped[str] = mapped_column(String(32), unique=True, nullable=False)
     created_date: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    user_id: Mapped[int] = mapped_column(ForeignKey('user_profile.id'))
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('user_profile.id'), index=True)
 
     user: Mapped['UserProfile'] = relationship('UserProfile')
 
@@ -68,7 +72,7 @@ class Director(Base):
     __tablename__ = 'director'
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    director_name: Mapped[str] = mapped_column(String(32), nullable=False)
+    director_name: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
     bio: Mapped[str] = mapped_column(Text)
     age: Mapped[int] = mapped_column(Integer)
     director_image: Mapped[str] = mapped_column(String)
@@ -79,6 +83,9 @@ class Director(Base):
 
 class MovieActor(Base):
     __tablename__ = 'movie_actor'
+    __table_args__ = (
+        Index('ix_movie_actor_actor_id_movie_id', 'actor_id', 'movie_id'),
+    )
 
     movie_id: Mapped[int] = mapped_column(ForeignKey('movie.id'), primary_key=True)
     actor_id: Mapped[int] = mapped_column(ForeignKey('actor.id'), primary_key=True)
@@ -88,7 +95,7 @@ class Actor(Base):
     __tablename__ = 'actor'
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    actor_name: Mapped[str] = mapped_column(String(32), nullable=False)
+    actor_name: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
     bio: Mapped[str] = mapped_column(Text)
     age: Mapped[int] = mapped_column(Integer)
     actor_image: Mapped[str] = mapped_column(String)
@@ -98,6 +105,9 @@ class Actor(Base):
 
 class MovieGenre(Base):
     __tablename__ = 'movie_genre'
+    __table_args__ = (
+        Index('ix_movie_genre_genre_id_movie_id', 'genre_id', 'movie_id'),
+    )
 
     movie_id: Mapped[int] = mapped_column(ForeignKey('movie.id'), primary_key=True)
     genre_id: Mapped[int] = mapped_column(ForeignKey('genre.id'), primary_key=True)
@@ -107,13 +117,19 @@ class Genre(Base):
     __tablename__ = 'genre'
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    genre_name: Mapped[str] = mapped_column(String(64), nullable=False)
+    genre_name: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
 
     genre_movie: Mapped[List['Movie']] = relationship('Movie', secondary='movie_genre', back_populates='genre')
 
 
 class Movie(Base):
     __tablename__ = 'movie'
+    __table_args__ = (
+        Index('ix_movie_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_movie_type', 'type', postgresql_using='gin'),
+        Index('ix_movie_year', 'year'),
+        Index('ix_movie_country_id', 'country_id'),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     movie_name: Mapped[str] = mapped_column(String(32), nullable=False)
@@ -127,6 +143,9 @@ class Movie(Base):
     country_id: Mapped[int] = mapped_column(ForeignKey('country.id'))
     director_id: Mapped[Optional[int]] = mapped_column(ForeignKey('director.id', ondelete='SET NULL'), nullable=True,
                                                        unique=True)
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR, Computed("to_tsvector('simple', coalesce(movie_name, '') || ' ' || coalesce(description, ''))",
+                           persisted=True), nullable=True, deferred=True)
 
     country: Mapped['Country'] = relationship('Country', back_populates='country_movie')
     director: Mapped['Director'] = relationship('Director', back_populates='director_movie')
@@ -136,6 +155,22 @@ class Movie(Base):
                                                         cascade='all, delete-orphan')
     movie_review: Mapped[List['Review']] = relationship('Review', back_populates='movie',
                                                         cascade='all, delete-orphan')
+    rating: Mapped[Optional['MovieRating']] = relationship('MovieRating', uselist=False, cascade='all, delete-orphan',
+                                                           passive_deletes=True)
+
+
+# running totals of the top-level star ratings, kept in step with every review write
+class MovieRating(Base):
+    __tablename__ = 'movie_rating'
+
+    movie_id: Mapped[int] = mapped_column(ForeignKey('movie.id', ondelete='CASCADE'), primary_key=True)
+    rating_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rating_sum: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    stars_1: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    stars_2: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    stars_3: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    stars_4: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    stars_5: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
 
 class MovieLanguage(Base):
@@ -151,20 +186,26 @@ class Moment(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     moment_image: Mapped[str] = mapped_column(String, nullable=False)
-    movie_id: Mapped[int] = mapped_column(ForeignKey('movie.id'))
+    movie_id: Mapped[int] = mapped_column(ForeignKey('movie.id'), index=True)
 
     movie: Mapped['Movie'] = relationship('Movie', back_populates='movie_moment')
 
 
 class Review(Base):
     __tablename__ = 'review'
+    __table_args__ = (
+        # one rating per user and movie; replies and text-only reviews are not ratings
+        Index('uq_review_user_id_movie_id_rating', 'user_id', 'movie_id', unique=True,
+              postgresql_where=sql_text('parent_id IS NULL AND stars IS NOT NULL')),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     stars: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
-    parent_id: Mapped[Optional[int]] = mapped_column(ForeignKey('review.id', ondelete='CASCADE'), nullable=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey('user_profile.id'))
-    movie_id: Mapped[int] = mapped_column(ForeignKey('movie.id'))
+    parent_id: Mapped[Optional[int]] = mapped_column(ForeignKey('review.id', ondelete='CASCADE'), nullable=True,
+                                                     index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('user_profile.id'), index=True)
+    movie_id: Mapped[int] = mapped_column(ForeignKey('movie.id'), index=True)
 
     parent: Mapped[Optional['Review']] = relationship('Review', remote_side=[id])
     movie: Mapped['Movie'] = relationship('Movie', back_populates='movie_review')
@@ -184,10 +225,13 @@ class Favorite(Base):
 
 class FavoriteItem(Base):
     __tablename__ = 'favorite_item'
+    __table_args__ = (
+        UniqueConstraint('favorite_id', 'movie_id', name='uq_favorite_item_favorite_id_movie_id'),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     favorite_id: Mapped[int] = mapped_column(ForeignKey('favorite.id'))
-    movie_id: Mapped[int] = mapped_column(ForeignKey('movie.id'))
+    movie_id: Mapped[int] = mapped_column(ForeignKey('movie.id'), index=True)
 
     favorite: Mapped['Favorite'] = relationship('Favorite', back_populates='items')
     movie: Mapped['Movie'] = relationship('Movie')
@@ -0,0 +1,91 @@
+import base64
+import json
+from datetime import date, datetime, time
+from typing import Dict, List, Optional
+from fastapi import HTTPException, Query
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from movie_app.config import settings
+
+
+class PageParams:
+    def __init__(self, cursor: Optional[str] = None,
+                 limit: int = Query(settings.PAGE_SIZE, ge=1, le=settings.PAGE_SIZE_MAX),
+                 sort: str = 'id'):
+        self.cursor = cursor
+        self.limit = limit
+        self.sort = sort
+
+    @property
+    def cache_field(self):
+        return f'{self.sort}:{self.limit}:{self.cursor or ""}'
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, time)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(columns):
+            raise ValueError
+        return [_coerce(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+def _coerce(column, value):
+    python_type = column.type.python_type
+    if python_type in (date, datetime, time):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def _sort_columns(page: PageParams, sort_fields: Dict[str, object]):
+    descending = page.sort.startswith('-')
+    sort_key = page.sort.lstrip('-')
+    if sort_key not in sort_fields:
+        raise HTTPException(status_code=400, detail=f'Sort must be one of: {", ".join(sort_fields)}')
+
+    columns = [sort_fields['id']] if sort_key == 'id' else [sort_fields[sort_key], sort_fields['id']]
+    return descending, columns
+
+
+# scalars=False pages a multi-column select; the cursor is then read by column, not by attribute
+async def paginate(db: AsyncSession, query: Select, page: PageParams, sort_fields: Dict[str, object],
+                   scalars: bool = True):
+    descending, columns = _sort_columns(page, sort_fields)
+    if page.cursor:
+        after = tuple_(*columns) < tuple(decode_cursor(page.cursor, columns)) if descending \
+            else tuple_(*columns) > tuple(decode_cursor(page.cursor, columns))
+        query = query.where(after)
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+
+    result = await db.execute(query.limit(page.limit + 1))
+    rows = result.scalars().all() if scalars else result.all()
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) if scalars else last._mapping[column]
+                                     for column in columns])
+    return {'items': rows, 'next_cursor': next_cursor}
+
+
+def paginate_rows(rows: List[dict], page: PageParams, sort_fields: Dict[str, object]):
+    descending, columns = _sort_columns(page, sort_fields)
+    keys = [column.key for column in columns]
+    rows = sorted(rows, key=lambda row: tuple(row[k] for k in keys), reverse=descending)
+    if page.cursor:
+        after = tuple(decode_cursor(page.cursor, columns))
+        rows = [row for row in rows
+                if (tuple(row[k] for k in keys) < after if descending else tuple(row[k] for k in keys) > after)]
+
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = encode_cursor([rows[-1][k] for k in keys])
+    return {'items': rows, 'next_cursor': next_cursor}
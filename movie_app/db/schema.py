@@ -1,8 +1,10 @@
-from pydantic import BaseModel, EmailStr, field_validator, conint
+from pydantic import BaseModel, EmailStr, field_validator, model_validator, computed_field, conint, conlist
 from datetime import datetime, date, time
-from typing import List, Optional
+from typing import Dict, Generic, List, Optional, TypeVar, Union
 from .models import StatusChoices, TypeChoices
 
+T = TypeVar('T')
+
 
 class UserProfileSchema(BaseModel):
     first_name: str
@@ -24,6 +26,13 @@ class UserProfileSchema(BaseModel):
         return v
 
 
+class CurrentUserSchema(BaseModel):
+    id: int
+    username: str
+    status: Optional[StatusChoices] = None
+    favorite_id: Optional[int] = None
+
+
 class CountrySchema(BaseModel):
     country_name: str
 
@@ -108,6 +117,62 @@ class MovieSchema(BaseModel):
         from_attributes = True
 
 
+# one line of a bulk import: references may be given by id or by name, unknown countries and
+# genres are created, unknown actors and directors only when the full object is supplied
+class MovieImportSchema(MovieSchema):
+    status_movie: StatusChoices = StatusChoices.simple
+    type: List[TypeChoices] = []
+    country_id: Optional[int] = None
+    country_name: Optional[str] = None
+    director_id: Optional[int] = None
+    director: Optional[Union[DirectorSchema, str]] = None
+    genre: List[str] = []
+    actor: List[Union[ActorSchema, str]] = []
+
+    @model_validator(mode='after')
+    def check_country(self):
+        if self.country_id is None and not self.country_name:
+            raise ValueError('Either country_id or country_name must be provided')
+        return self
+
+
+class MovieImportErrorSchema(BaseModel):
+    line: int
+    error: str
+    last_line: Optional[int] = None
+
+
+class MovieImportResultSchema(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: List[MovieImportErrorSchema] = []
+
+
+class RankedMovieSchema(BaseModel):
+    id: int
+    movie_name: str
+    movie_image: str
+    year: date
+    score: float
+
+
+class MovieLinkSchema(BaseModel):
+    movie_ids: conlist(int, min_length=1, max_length=500)
+    ids: conlist(int, max_length=500) = []
+
+
+class MovieLinkResultSchema(BaseModel):
+    added: int = 0
+    removed: int = 0
+
+
+class MovieFacetsSchema(BaseModel):
+    genre: Dict[int, int] = {}
+    country: Dict[int, int] = {}
+    status_movie: Dict[str, int] = {}
+    type: Dict[str, int] = {}
+
+
 class MovieLanguageSchema(BaseModel):
     language: str
     video: str
@@ -148,6 +213,93 @@ class ReviewSchema(BaseModel):
         return v
 
 
+class ReviewCreateSchema(BaseModel):
+    stars: Optional[conint(ge=1, le=5)] = None
+    text: str
+    parent_id: Optional[int] = None
+    movie_id: int
+
+    @field_validator('text', mode='before')
+    def validate_text(cls, v):
+        if v is None or v.strip() == "":
+            raise ValueError("Text cannot be empty.")
+        return v
+
+
+class ReviewUpdateSchema(BaseModel):
+    stars: Optional[conint(ge=1, le=5)] = None
+    text: str
+
+    @field_validator('text', mode='before')
+    def validate_text(cls, v):
+        if v is None or v.strip() == "":
+            raise ValueError("Text cannot be empty.")
+        return v
+
+
+class ReviewDetailSchema(BaseModel):
+    id: int
+    stars: Optional[int]
+    text: Optional[str]
+    parent_id: Optional[int]
+    user_id: int
+    movie_id: int
+
+    class Config:
+        from_attributes = True
+
+
+class ReviewTreeSchema(BaseModel):
+    id: int
+    stars: Optional[int]
+    text: Optional[str]
+    parent_id: Optional[int]
+    user_id: int
+    depth: int = 0
+    total_replies: Optional[int] = None
+    replies: List['ReviewTreeSchema'] = []
+
+
+class MovieRatingSchema(BaseModel):
+    rating_count: int = 0
+    rating_sum: int = 0
+    stars_1: int = 0
+    stars_2: int = 0
+    stars_3: int = 0
+    stars_4: int = 0
+    stars_5: int = 0
+
+    class Config:
+        from_attributes = True
+
+    @computed_field
+    @property
+    def average(self) -> Optional[float]:
+        return round(self.rating_sum / self.rating_count, 2) if self.rating_count else None
+
+
+class MovieCardReviewSchema(BaseModel):
+    id: int
+    stars: Optional[int]
+    text: Optional[str]
+    parent_id: Optional[int]
+    user_id: int
+
+    class Config:
+        from_attributes = True
+
+
+class MovieCardSchema(MovieSchema):
+    id: int
+    country: CountrySchema
+    director: Optional[DirectorSchema]
+    actor: List[ActorSchema] = []
+    genre: List[GenreSchema] = []
+    movie_moment: List[MomentSchema] = []
+    movie_review: List[MovieCardReviewSchema] = []
+    rating: Optional[MovieRatingSchema] = None
+
+
 class FavoriteItemSchema(BaseModel):
     id: int
     movie_id: int
@@ -164,9 +316,35 @@ class FavoriteSchema(BaseModel):
         from_attributes = True
 
 
+class FavoriteMovieSchema(BaseModel):
+    id: int
+    movie_id: int
+    movie_name: str
+    movie_image: str
+    year: date
+    genre: List[str] = []
+
+    class Config:
+        from_attributes = True
+
+
 class FavoriteItemCreateSchema(BaseModel):
     movie_id: int
 
     class Config:
         from_attributes = True
 
+
+class FavoriteBatchSchema(BaseModel):
+    add: conlist(int, max_length=500) = []
+    remove: conlist(int, max_length=500) = []
+
+
+class FavoriteBatchResultSchema(BaseModel):
+    added: List[int] = []
+    removed: List[int] = []
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
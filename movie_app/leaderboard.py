@@ -0,0 +1,190 @@
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from movie_app import cache
+from movie_app.config import settings
+from movie_app.db.models import MovieRating
+
+WINDOWS = ('all', 'day', 'week')
+FAVORITE_WEIGHT = 1.0
+REVIEW_WEIGHT = 2.0
+
+TRENDING_KEY = cache.key('leaderboard', 'trending')
+TRENDING_EPOCH_KEY = cache.key('leaderboard', 'trending', 'epoch')
+TOP_KEY = cache.key('leaderboard', 'top')
+
+# forward decay: an event at time t adds 2^((t - epoch) / half_life), so older events shrink relative
+# to newer ones without ever rewriting them. Once the multiplier gets large the board is scaled back
+# to a fresh epoch and the entries that decayed to nothing are dropped, all inside the same script
+DECAYED_INCR = """
+local now = tonumber(ARGV[1])
+local half_life = tonumber(ARGV[2])
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if not epoch then
+    epoch = now
+    redis.call('SET', KEYS[2], now)
+end
+local age = (now - epoch) / half_life
+if age > tonumber(ARGV[3]) then
+    redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', 2 ^ -age)
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[4])
+    redis.call('SET', KEYS[2], now)
+    age = 0
+end
+local step = tonumber(ARGV[5]) * 2 ^ age
+for i = 6, #ARGV do
+    redis.call('ZINCRBY', KEYS[1], step, ARGV[i])
+end
+return 1
+"""
+
+
+# the rating board is rebuilt from movie_rating when missing; updates only land on a built board,
+# otherwise the first update would leave a one-member board that never gets rebuilt
+ZADD_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _hour_key(moment: datetime):
+    return cache.key('leaderboard', 'trending', 'hour', moment.strftime('%Y%m%d%H'))
+
+
+def _day_key(moment: datetime):
+    return cache.key('leaderboard', 'trending', 'day', moment.strftime('%Y%m%d'))
+
+
+def _window_key(window: str):
+    return cache.key('leaderboard', 'trending', window)
+
+
+@lru_cache(maxsize=1)
+def _decayed_incr(client):
+    return client.register_script(DECAYED_INCR)
+
+
+@lru_cache(maxsize=1)
+def _zadd_if_exists(client):
+    return client.register_script(ZADD_IF_EXISTS)
+
+
+async def record(movie_ids: Iterable[int], amount: float):
+    # one favorite or review is one event; a removed favorite takes its weight back at today's value
+    movie_ids = list(movie_ids)
+    if cache.redis is None or not movie_ids or not amount:
+        return
+    now = datetime.now(timezone.utc)
+    try:
+        await _decayed_incr(cache.redis)(
+            keys=[TRENDING_KEY, TRENDING_EPOCH_KEY],
+            args=[now.timestamp(), settings.TRENDING_HALF_LIFE, settings.TRENDING_REBASE_AFTER,
+                  settings.TRENDING_MIN_SCORE, amount, *movie_ids])
+        async with cache.redis.pipeline(transaction=False) as pipe:
+            for bucket, ttl in ((_hour_key(now), timedelta(hours=25)), (_day_key(now), timedelta(days=8))):
+                for movie_id in movie_ids:
+                    pipe.zincrby(bucket, amount, movie_id)
+                pipe.expire(bucket, ttl)
+            await pipe.execute()
+    except RedisError:
+        pass
+
+
+def bayesian_rating(rating_count: int, rating_sum: int) -> float:
+    # a handful of 5-star votes should not outrank hundreds of 4.5s: pull small counts to the prior
+    prior = settings.TOP_PRIOR_COUNT
+    return (prior * settings.TOP_PRIOR_MEAN + rating_sum) / (prior + rating_count)
+
+
+async def update_top(db, movie_id: int):
+    # call after the commit: totals read inside two concurrent transactions could land out of order,
+    # a read after both commits cannot. TOP_TTL bounds whatever still slips through
+    if cache.redis is None:
+        return
+    row = (await db.execute(select(MovieRating.rating_count, MovieRating.rating_sum)
+                            .where(MovieRating.movie_id == movie_id))).one_or_none()
+    try:
+        if row is not None and row.rating_count > 0:
+            await _zadd_if_exists(cache.redis)(keys=[TOP_KEY],
+                                               args=[bayesian_rating(row.rating_count, row.rating_sum), movie_id])
+        else:
+            await cache.redis.zrem(TOP_KEY, movie_id)
+    except RedisError:
+        await cache.invalidate(TOP_KEY)
+
+
+async def _rebuild_top(db):
+    rows = (await db.execute(select(MovieRating.movie_id, MovieRating.rating_count, MovieRating.rating_sum)
+                             .where(MovieRating.rating_count > 0))).all()
+    if rows:
+        async with cache.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(TOP_KEY)
+            pipe.zadd(TOP_KEY, {movie_id: bayesian_rating(count, total) for movie_id, count, total in rows})
+            pipe.expire(TOP_KEY, settings.TOP_TTL)
+            await pipe.execute()
+
+
+async def forget(movie_ids: Iterable[int]):
+    # a deleted movie leaves every board, including the buckets the day and week windows are built from
+    movie_ids = list(movie_ids)
+    if cache.redis is None or not movie_ids:
+        return
+    now = datetime.now(timezone.utc)
+    keys = [TRENDING_KEY, TOP_KEY, *map(_window_key, WINDOWS[1:]),
+            *[_hour_key(now - timedelta(hours=hours)) for hours in range(25)],
+            *[_day_key(now - timedelta(days=days)) for days in range(8)]]
+    try:
+        async with cache.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.zrem(key, *movie_ids)
+            await pipe.execute()
+    except RedisError:
+        pass
+
+
+async def _window(window: str) -> Tuple[str, float]:
+    if window == 'all':
+        epoch = await cache.redis.get(TRENDING_EPOCH_KEY)
+        # scores are stored against the epoch, divide them back down to today's scale
+        age = (time.time() - float(epoch)) / settings.TRENDING_HALF_LIFE if epoch else 0.0
+        return TRENDING_KEY, 2 ** -age
+
+    # a day is the last 24 hourly buckets, a week the last 7 daily ones; the union is kept briefly
+    key = _window_key(window)
+    if not await cache.redis.exists(key):
+        now = datetime.now(timezone.utc)
+        buckets = [_hour_key(now - timedelta(hours=hours)) for hours in range(24)] if window == 'day' \
+            else [_day_key(now - timedelta(days=days)) for days in range(7)]
+        async with cache.redis.pipeline(transaction=True) as pipe:
+            pipe.zunionstore(key, buckets)
+            pipe.expire(key, settings.TRENDING_WINDOW_TTL)
+            await pipe.execute()
+    return key, 1.0
+
+
+async def trending(window: str, limit: int) -> Optional[List[Tuple[int, float]]]:
+    if cache.redis is None:
+        return None
+    try:
+        key, scale = await _window(window)
+        rows = await cache.redis.zrevrangebyscore(key, '+inf', '(0', start=0, num=limit, withscores=True)
+    except RedisError:
+        return None
+    return [(int(member), round(score * scale, 4)) for member, score in rows]
+
+
+async def top(db, limit: int) -> Optional[List[Tuple[int, float]]]:
+    if cache.redis is None:
+        return None
+    try:
+        if not await cache.redis.exists(TOP_KEY):
+            await _rebuild_top(db)
+        rows = await cache.redis.zrevrange(TOP_KEY, 0, limit - 1, withscores=True)
+    except RedisError:
+        return None
+    return [(int(member), round(score, 4)) for member, score in rows]
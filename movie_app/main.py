@@ -1,27 +1,43 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import exc
 import uvicorn
 from movie_app.api import (country, genre, actor, director, movie, moment, movie_language, auth,
-                           social_auth, favorite)
-import redis.asyncio as aioredis
+                           social_auth, favorite, review, movie_actor, movie_genre, stats)
 from contextlib import asynccontextmanager
 from fastapi_limiter import FastAPILimiter
 from starlette.middleware.sessions import SessionMiddleware
-
-
-async def init_redis():
-    return aioredis.from_url('redis://localhost', encoding='utf-8', decode_responses=True)
+from movie_app.db.database import engine
+from movie_app.cache import init_redis
+from movie_app.compression import CompressionMiddleware
+from movie_app.config import settings
+from movie_app.similar import similar_rebuilder
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     redis = await init_redis()
     await FastAPILimiter.init(redis)
+    sweeper = asyncio.create_task(auth.refresh_token_sweeper())
+    rebuilder = asyncio.create_task(similar_rebuilder())
     yield
+    sweeper.cancel()
+    rebuilder.cancel()
     await redis.close()
+    await engine.dispose()
 
 
 movie_app = FastAPI(title='Movie', lifespan=lifespan)
 movie_app.add_middleware(SessionMiddleware, secret_key="SECRET_KEY")  # for github or google
+movie_app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESS_MIN_SIZE)
+
+
+@movie_app.exception_handler(exc.TimeoutError)
+async def db_busy_handler(request: Request, error: exc.TimeoutError):
+    return JSONResponse(status_code=503, content={'detail': 'Database is busy, try again later'},
+                        headers={'Retry-After': '1'})
+
 
 movie_app.include_router(auth.auth_router)
 movie_app.include_router(country.country_router)
@@ -29,10 +45,14 @@ movie_app.include_router(genre.genre_router)
 movie_app.include_router(actor.actor_router)
 movie_app.include_router(director.director_router)
 movie_app.include_router(movie.movie_router)
+movie_app.include_router(movie_actor.movie_actor_router)
+movie_app.include_router(movie_genre.movie_genre_router)
 movie_app.include_router(moment.moment_router)
 movie_app.include_router(movie_language.movie_lang_router)
 movie_app.include_router(social_auth.social_router)
 movie_app.include_router(favorite.favorite_router)
+movie_app.include_router(review.review_router)
+movie_app.include_router(stats.stats_router)
 
 if __name__ == '__main__':
     uvicorn.run(movie_app, host='127.0.0.1', port=8000)
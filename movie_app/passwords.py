@@ -0,0 +1,39 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from movie_app.config import settings
+
+# min == max == default, so any change of BCRYPT_ROUNDS marks old hashes for a rehash
+password_context = CryptContext(
+    schemes=['bcrypt'],
+    deprecated='auto',
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_WORKERS, thread_name_prefix='bcrypt')
+_slots = asyncio.Semaphore(settings.PASSWORD_WORKERS + settings.PASSWORD_QUEUE_SIZE)
+
+
+async def _run(fn, *args):
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=settings.PASSWORD_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail='Too many password checks in progress, try again later',
+                            headers={'Retry-After': '1'})
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _slots.release()
+
+
+async def hash_password(password: str) -> str:
+    return await _run(password_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # the second value is a fresh hash when the stored one was made with another cost factor
+    return await _run(password_context.verify_and_update, password, hashed_password)
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import List, Optional
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from movie_app import cache
+from movie_app.config import settings
+from movie_app.db.database import SessionLocal
+from movie_app.db.models import Country, Genre, MovieLanguage
+
+
+# per-worker copy of a small lookup table; after REFERENCE_TTL it checks the shared
+# version counter in Redis and reloads only if some worker has written since
+class ReferenceTable:
+    def __init__(self, model):
+        self.model = model
+        self.columns = [column.key for column in model.__table__.columns]
+        self.version_key = cache.key(model.__tablename__, 'version')
+        self.rows = {}
+        self.etags = {}
+        self.etag = None
+        self.version = None
+        self.loaded = False
+        self.checked_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def _fresh(self):
+        return self.loaded and time.monotonic() - self.checked_at < settings.REFERENCE_TTL
+
+    async def _shared_version(self):
+        if cache.redis is None:
+            return None
+        try:
+            return await cache.redis.get(self.version_key)
+        except RedisError:
+            return None
+
+    async def _refresh(self):
+        if self._fresh():
+            return
+        async with self.lock:
+            if self._fresh():
+                return
+            version = await self._shared_version()
+            if not self.loaded or version is None or version != self.version:
+                async with SessionLocal() as db:
+                    result = await db.scalars(select(self.model))
+                    self.rows = {row.id: {key: getattr(row, key) for key in self.columns} for row in result}
+                self.etags = {row_id: cache.make_etag(repr(row)) for row_id, row in self.rows.items()}
+                self.etag = cache.make_etag(''.join(self.etags[row_id] for row_id in sorted(self.etags)))
+                self.version = version
+                self.loaded = True
+            self.checked_at = time.monotonic()
+
+    async def all(self) -> List[dict]:
+        await self._refresh()
+        return list(self.rows.values())
+
+    async def get(self, obj_id: int) -> Optional[dict]:
+        await self._refresh()
+        return self.rows.get(obj_id)
+
+    def row_etag(self, obj_id: int) -> str:
+        return self.etags[obj_id]
+
+    def page_etag(self, page) -> str:
+        return cache.make_etag(f'{self.etag}:{page.cache_field}')
+
+    async def invalidate(self):
+        self.loaded = False
+        if cache.redis is None:
+            return
+        try:
+            await cache.redis.incr(self.version_key)
+        except RedisError:
+            pass
+
+
+countries = ReferenceTable(Country)
+genres = ReferenceTable(Genre)
+movie_languages = ReferenceTable(MovieLanguage)
@@ -0,0 +1,246 @@
+import asyncio
+import heapq
+import logging
+import numpy as np
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select
+from movie_app.config import settings
+from movie_app.db.database import SessionLocal
+from movie_app.db.models import Movie, MovieActor, MovieGenre
+
+logger = logging.getLogger(__name__)
+
+# a shared director says more than a shared country; weights are per feature kind
+FEATURE_WEIGHTS = {'genre': 1.0, 'actor': 1.0, 'director': 2.0, 'country': 0.5, 'year': 0.5}
+YEAR_BUCKET = 5
+
+
+def movie_features(country_id, director_id, year, genre_ids: Iterable[int], actor_ids: Iterable[int]):
+    features = {('genre', genre_id): FEATURE_WEIGHTS['genre'] for genre_id in genre_ids}
+    features.update({('actor', actor_id): FEATURE_WEIGHTS['actor'] for actor_id in actor_ids})
+    if director_id is not None:
+        features['director', director_id] = FEATURE_WEIGHTS['director']
+    if country_id is not None:
+        features['country', country_id] = FEATURE_WEIGHTS['country']
+    if year is not None:
+        features['year', year.year // YEAR_BUCKET] = FEATURE_WEIGHTS['year']
+    return features
+
+
+async def load_features(db, movie_ids: Optional[List[int]] = None) -> Dict[int, dict]:
+    movies = select(Movie.id, Movie.country_id, Movie.director_id, Movie.year)
+    genres = select(MovieGenre.movie_id, MovieGenre.genre_id)
+    actors = select(MovieActor.movie_id, MovieActor.actor_id)
+    if movie_ids is not None:
+        movies = movies.where(Movie.id.in_(movie_ids))
+        genres = genres.where(MovieGenre.movie_id.in_(movie_ids))
+        actors = actors.where(MovieActor.movie_id.in_(movie_ids))
+
+    genre_ids, actor_ids = defaultdict(list), defaultdict(list)
+    for movie_id, genre_id in (await db.execute(genres)).all():
+        genre_ids[movie_id].append(genre_id)
+    for movie_id, actor_id in (await db.execute(actors)).all():
+        actor_ids[movie_id].append(actor_id)
+    return {movie_id: movie_features(country_id, director_id, year, genre_ids[movie_id], actor_ids[movie_id])
+            for movie_id, country_id, director_id, year in (await db.execute(movies)).all()}
+
+
+# sparse multi-hot matrix: every movie is a row holding the columns (features) it has, every column
+# keeps the rows that have it. A movie's dot products come from the postings of its own columns, so
+# every movie sharing a feature is scored exactly and the loops run inside numpy; the top-k is exact
+class SimilarityIndex:
+    def __init__(self, top_k: int, posting_limit: int):
+        self.top_k = top_k
+        self.posting_limit = posting_limit
+        self.vocabulary: Dict[tuple, int] = {}
+        self.weights = np.zeros(0)
+        self.postings: List[np.ndarray] = []
+        self.movie_ids: List[Optional[int]] = []
+        self.rows: Dict[int, int] = {}
+        self.columns: Dict[int, np.ndarray] = {}
+        self.norms = np.zeros(0)
+        self.neighbours: Dict[int, List[Tuple[int, float]]] = {}
+
+    def _columns(self, features: dict) -> np.ndarray:
+        new = [feature for feature in features if feature not in self.vocabulary]
+        for feature in new:
+            self.vocabulary[feature] = len(self.vocabulary)
+            self.postings.append(np.zeros(0, dtype=np.int32))
+        if new:
+            self.weights = np.append(self.weights, [features[feature] for feature in new])
+        return np.array(sorted(self.vocabulary[feature] for feature in features), dtype=np.int32)
+
+    def _norm(self, columns: np.ndarray) -> float:
+        return float(np.sqrt(np.sum(self.weights[columns] ** 2)))
+
+    def _dots(self, columns: np.ndarray):
+        # every row sharing a column with the full dot product. Postings shorter than posting_limit are
+        # summed over their own rows; once one is crowded, like a genre shared by half the catalog, one
+        # catalog-length bincount is cheaper than sorting the rows out
+        if not len(columns):
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        postings = [self.postings[column] for column in columns]
+        weights = np.concatenate([np.full(len(posting), self.weights[column] ** 2)
+                                  for column, posting in zip(columns, postings)])
+        if any(len(posting) > self.posting_limit for posting in postings):
+            dots = np.bincount(np.concatenate(postings), weights=weights, minlength=len(self.movie_ids))
+            rows = np.flatnonzero(dots)
+            return rows, dots[rows]
+        rows, inverse = np.unique(np.concatenate(postings), return_inverse=True)
+        return rows, np.bincount(inverse, weights=weights, minlength=len(rows))
+
+    def _scores(self, movie_id: int):
+        row = self.rows[movie_id]
+        rows, dots = self._dots(self.columns[movie_id])
+        keep = rows != row
+        rows, dots = rows[keep], dots[keep]
+        return rows, dots / (self.norms[rows] * self.norms[row])
+
+    def compute(self, movie_id: int) -> List[Tuple[int, float]]:
+        rows, scores = self._scores(movie_id)
+        if not len(rows):
+            return []
+        top = np.argpartition(-scores, min(self.top_k, len(scores)) - 1)[:self.top_k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.movie_ids[rows[i]], round(float(scores[i]), 4)) for i in top]
+
+    def similarity(self, movie_id: int, other_id: int) -> float:
+        shared = np.intersect1d(self.columns[movie_id], self.columns[other_id], assume_unique=True)
+        norm = self.norms[self.rows[movie_id]] * self.norms[self.rows[other_id]]
+        return float(np.sum(self.weights[shared] ** 2) / norm) if norm else 0.0
+
+    def build(self, features: Dict[int, dict]):
+        postings = defaultdict(list)
+        for movie_id, vector in features.items():
+            row = len(self.movie_ids)
+            self.movie_ids.append(movie_id)
+            self.rows[movie_id] = row
+            self.columns[movie_id] = self._columns(vector)
+            for column in self.columns[movie_id]:
+                postings[column].append(row)
+        self.postings = [np.array(postings[column], dtype=np.int32) for column in range(len(self.vocabulary))]
+        self.norms = np.array([self._norm(self.columns[movie_id]) for movie_id in self.movie_ids])
+        for movie_id in self.movie_ids:
+            self.neighbours[movie_id] = self.compute(movie_id)
+        return self
+
+    def _discard(self, movie_id: int):
+        row = self.rows[movie_id]
+        for column in self.columns.pop(movie_id):
+            self.postings[column] = self.postings[column][self.postings[column] != row]
+        self.norms[row] = 0.0
+        self.neighbours.pop(movie_id, None)
+
+    def update(self, movie_id: int, features: Optional[dict]):
+        # the changed movie gets a fresh top-k; other movies only take it in, rescore it or drop it,
+        # and a slot it leaves open is filled on the next rebuild
+        scores: Dict[int, float] = {}
+        if movie_id in self.columns:
+            scores.update(dict.fromkeys(self._dots(self.columns[movie_id])[0].tolist(), 0.0))
+            self._discard(movie_id)
+        if features is not None:
+            if movie_id not in self.rows:
+                self.rows[movie_id] = len(self.movie_ids)
+                self.movie_ids.append(movie_id)
+                self.norms = np.append(self.norms, 0.0)
+            row = self.rows[movie_id]
+            columns = self._columns(features)
+            self.columns[movie_id] = columns
+            for column in columns:
+                self.postings[column] = np.append(self.postings[column], np.int32(row))
+            self.norms[row] = self._norm(columns)
+            rows, new_scores = self._scores(movie_id)
+            scores.update(zip(rows.tolist(), new_scores.tolist()))
+            self.neighbours[movie_id] = self.compute(movie_id)
+
+        for other_row, score in scores.items():
+            other_id = self.movie_ids[other_row]
+            if other_id == movie_id or other_id not in self.columns:
+                continue
+            entries = self.neighbours.get(other_id, [])
+            listed = any(entry[0] == movie_id for entry in entries)
+            if not listed and (score <= 0 or len(entries) >= self.top_k and score <= entries[-1][1]):
+                continue
+            entries = [entry for entry in entries if entry[0] != movie_id]
+            if score > 0:
+                entries.append((movie_id, round(score, 4)))
+            self.neighbours[other_id] = heapq.nlargest(self.top_k, entries, key=lambda entry: entry[1])
+
+index: Optional[SimilarityIndex] = None
+# _lock serialises changes to the live index, _rebuild_lock keeps one rebuild at a time;
+# ids refreshed while a rebuild runs are collected in _pending and replayed before the swap
+_lock = asyncio.Lock()
+_rebuild_lock = asyncio.Lock()
+_pending: Optional[Set[int]] = None
+
+
+def _apply(target: SimilarityIndex, movie_ids: List[int], features: Dict[int, dict]):
+    for movie_id in movie_ids:
+        target.update(movie_id, features.get(movie_id))
+
+
+async def rebuild(if_missing: bool = False):
+    global index, _pending
+    async with _rebuild_lock:
+        if if_missing and index is not None:
+            return
+        _pending = set()
+        try:
+            async with SessionLocal() as db:
+                features = await load_features(db)
+            # scoring is plain CPU work, keep it off the event loop and swap the finished index in
+            fresh = await asyncio.to_thread(
+                SimilarityIndex(settings.SIMILAR_TOP_K, settings.SIMILAR_POSTING_LIMIT).build, features)
+            async with _lock:
+                changed, _pending = list(_pending), None
+                if changed:
+                    async with SessionLocal() as db:
+                        features = await load_features(db, changed)
+                    await asyncio.to_thread(_apply, fresh, changed, features)
+                index = fresh
+        finally:
+            _pending = None
+
+
+async def ensure_index() -> bool:
+    # builds the first index on demand; False when that failed and there is nothing to serve
+    if index is None:
+        try:
+            await rebuild(if_missing=True)
+        except Exception:
+            logger.exception('Similar movies build failed')
+    return index is not None
+
+
+async def neighbours(db, movie_id: int, limit: int) -> Optional[List[Tuple[int, float]]]:
+    # call after ensure_index()
+    if movie_id not in index.columns:
+        # may have been created through another worker since the last rebuild
+        await refresh_movies(db, [movie_id])
+    if movie_id not in index.columns:
+        return None
+    return index.neighbours.get(movie_id, [])[:limit]
+
+
+async def refresh_movies(db, movie_ids: Iterable[int]):
+    # call after a commit that changed a movie or its links; other workers catch up on their rebuild
+    movie_ids = list(movie_ids)
+    if _pending is not None:
+        _pending.update(movie_ids)
+    if index is None:
+        return
+    features = await load_features(db, movie_ids)
+    async with _lock:
+        # a batch of links can touch hundreds of movies, each update is numpy work off the loop
+        await asyncio.to_thread(_apply, index, movie_ids, features)
+
+
+async def similar_rebuilder():
+    while True:
+        try:
+            await rebuild()
+            logger.info('Rebuilt similar movies for %s movies', len(index.columns))
+        except Exception:
+            logger.exception('Similar movies rebuild failed')
+        await asyncio.sleep(settings.SIMILAR_REBUILD_INTERVAL)
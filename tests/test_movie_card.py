@@ -0,0 +1,94 @@
+import asyncio
+from datetime import date, time
+from sqlalchemy import event, literal
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import StaticPool
+from movie_app.api.movie import load_card
+from movie_app.config import settings
+from movie_app.db.database import Base
+from movie_app.db.models import (Actor, Country, Director, Genre, Moment, Movie, MovieRating, Review, StatusChoices,
+                                 UserProfile)
+
+
+# the card query only needs the tables, not the postgres column types
+@compiles(ARRAY, 'sqlite')
+def _array(element, compiler, **kw):
+    return 'JSON'
+
+
+@compiles(TSVECTOR, 'sqlite')
+def _tsvector(element, compiler, **kw):
+    return 'TEXT'
+
+
+async def _engine():
+    engine = create_async_engine('sqlite+aiosqlite://', poolclass=StaticPool)
+
+    @event.listens_for(engine.sync_engine, 'connect')
+    def _functions(connection, record):
+        connection.create_function('to_tsvector', 2, lambda config, text: text, deterministic=True)
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    return engine
+
+
+async def _seed(db: AsyncSession, reviews: int):
+    db.add(Country(id=1, country_name='Kyrgyzstan'))
+    db.add(Director(id=1, director_name='Director', bio='bio', age=40, director_image='d.jpg'))
+    # sqlite cannot bind the list an ARRAY column sends; postgres' own '{}' reads back as an empty array
+    db.add(Movie(id=1, movie_name='Movie', movie_trailer='t', movie_image='i', status_movie=StatusChoices.pro,
+                 year=date(2000, 1, 1), type=literal('{}'), movie_time=time(1, 30), description='d', country_id=1,
+                 director_id=1, actor=[Actor(actor_name=f'Actor {i}', bio='bio', age=30, actor_image='a.jpg')
+                                       for i in range(3)],
+                 genre=[Genre(genre_name='Drama'), Genre(genre_name='Comedy')]))
+    db.add(Moment(moment_image='m.jpg', movie_id=1))
+    db.add(MovieRating(movie_id=1, rating_count=reviews, rating_sum=4 * reviews, stars_1=0, stars_2=0, stars_3=0,
+                       stars_4=reviews, stars_5=0))
+    for i in range(reviews + 1):
+        db.add(UserProfile(id=i + 1, first_name='user', username=f'user{i}', hashed_password='x', phone='0',
+                           age=20, status=StatusChoices.simple))
+    for i in range(reviews):
+        db.add(Review(id=i + 1, stars=4, text='text', user_id=i + 1, movie_id=1))
+    await db.flush()
+    # the latest review of all is a reply, the card must skip it
+    db.add(Review(stars=None, text='reply', parent_id=reviews, user_id=reviews + 1, movie_id=1))
+    await db.commit()
+
+
+async def _load_card_statements():
+    engine = await _engine()
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        await _seed(db, settings.CARD_REVIEWS + 5)
+
+    statements = []
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def _count(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    async with AsyncSession(engine) as db:
+        movie = await load_card(db, 1)
+    await engine.dispose()
+    return movie, statements
+
+
+def test_movie_card_takes_five_statements():
+    movie, statements = asyncio.run(_load_card_statements())
+
+    assert len(statements) == 5, statements
+    assert movie.country.country_name == 'Kyrgyzstan'
+    assert movie.director.director_name == 'Director'
+    assert len(movie.actor) == 3 and len(movie.genre) == 2 and len(movie.movie_moment) == 1
+    assert movie.rating.rating_count == settings.CARD_REVIEWS + 5
+
+
+def test_movie_card_keeps_only_latest_top_level_reviews():
+    movie, _ = asyncio.run(_load_card_statements())
+
+    assert len(movie.movie_review) == settings.CARD_REVIEWS
+    assert all(review.parent_id is None for review in movie.movie_review)
+    assert [review.id for review in movie.movie_review] == sorted((review.id for review in movie.movie_review),
+                                                                  reverse=True)
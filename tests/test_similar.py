@@ -0,0 +1,63 @@
+import random
+import numpy as np
+from movie_app.similar import SimilarityIndex, movie_features
+
+TOP_K = 10
+
+
+def _features(count: int, seed: int):
+    rng = random.Random(seed)
+    # few genres and countries, so those postings grow past the limit and take the catalog-wide path
+    return {movie_id: movie_features(rng.randrange(5), rng.randrange(40), None,
+                                     rng.sample(range(8), rng.randint(1, 3)),
+                                     rng.sample(range(300), rng.randint(0, 4)))
+            for movie_id in range(1, count + 1)}
+
+
+def _brute_force(features: dict, movie_id: int):
+    # plain cosine over dicts against every other movie in the catalog
+    vector = features[movie_id]
+    norm = np.sqrt(sum(weight ** 2 for weight in vector.values()))
+    scores = []
+    for other_id, other in features.items():
+        if other_id == movie_id:
+            continue
+        dot = sum(weight * other[feature] for feature, weight in vector.items() if feature in other)
+        if dot:
+            scores.append(dot / (norm * np.sqrt(sum(weight ** 2 for weight in other.values()))))
+    return sorted(scores, reverse=True)[:TOP_K]
+
+
+def _assert_exact(index: SimilarityIndex, features: dict, movie_id: int):
+    # ties make the ids ambiguous, the ranked scores are not
+    expected = _brute_force(features, movie_id)
+    got = [score for _, score in index.neighbours[movie_id]]
+    assert np.allclose(got, expected, atol=1e-4), movie_id
+    for other_id, score in index.neighbours[movie_id]:
+        assert abs(index.similarity(movie_id, other_id) - score) < 1e-4
+
+
+def test_build_matches_brute_force_cosine():
+    features = _features(400, seed=1)
+    index = SimilarityIndex(TOP_K, posting_limit=20).build(features)
+
+    for movie_id in features:
+        _assert_exact(index, features, movie_id)
+
+
+def test_updated_movie_gets_an_exact_top_k():
+    features = _features(300, seed=2)
+    index = SimilarityIndex(TOP_K, posting_limit=20).build(features)
+
+    features[7] = features[8]
+    features[301] = dict(features[9])
+    index.update(7, features[7])
+    index.update(301, features[301])
+    del features[10]
+    index.update(10, None)
+
+    _assert_exact(index, features, 7)
+    _assert_exact(index, features, 301)
+    assert index.neighbours[7][0] == (8, 1.0)
+    assert 10 not in index.columns
+    assert all(other_id != 10 for entries in index.neighbours.values() for other_id, _ in entries)